@@ -1,89 +1,167 @@
 # agent_builder.py
 
-from crewai import Agent, LLM
-from crewai.tools import BaseTool
-from typing import Dict, List, Any
-import requests
-import json
+from typing import Dict, List, Any, Optional, Callable, TYPE_CHECKING
+from collections import OrderedDict
 import os
+import threading
+import time
 from dotenv import load_dotenv
-from pprint import pprint
-from data_service import fetch_agent_metadata, fetch_tools_metadata, safe_json_load, fetch_agent_configs
+from metrics import span, instrument_llm_calls, register_gauges
+from llm_limiter import govern_llm, get_llm_limiter
+from llm_cache import cache_llm
+from tool_registry import tool_registry, content_version
+from data_service import fetch_agent_metadata, fetch_tools_metadata, fetch_agent_configs
 load_dotenv()
 
+# crewai (and the LLM stack behind it) is imported on first agent build, not at import
+if TYPE_CHECKING:
+    from crewai import Agent
+    from crewai.tools import BaseTool
 
 
-class APICallTool(BaseTool):
-    name: str
-    description: str
-    endpoint_url: str
-    http_method: str
-    headers: Dict[str, Any] = None
-    query_params: Dict[str, Any] = None
-    body: Dict[str, Any] = None
-
-    def _run(self, **kwargs) -> str:
-        try:
-            headers = self.headers or {}
-            params = self.query_params or {}
-            data = self.body or {}
-
-            method = self.http_method.upper()
-
-            response = requests.request(
-                method=method,
-                url=self.endpoint_url,
-                headers=headers,
-                params=params,
-                json=data if method in ["POST", "PUT", "PATCH"] else None,
-                data=data if method not in ["POST", "PUT", "PATCH"] else None
-            )
-
-            response.raise_for_status()
-            return response.text
-        except Exception as e:
-            return f"API call failed: {str(e)}"
-
-
-def build_tools_from_metadata(tool_data_list: List[Dict[str, Any]]) -> List[BaseTool]:
-    tools = []
-    for tool_data in tool_data_list:
-        headers = safe_json_load(tool_data.get("headers"))
-        params = safe_json_load(tool_data.get("query_params"))
-        body = safe_json_load(tool_data.get("body"))
-
-        tool = APICallTool(
-            name=tool_data["name"],
-            description=tool_data.get("tool_description", "No description"),
-            endpoint_url=tool_data["endpoint_url"],
-            http_method=tool_data["http_method"],
-            headers=headers,
-            query_params=params,
-            body=body
-        )
-        tools.append(tool)
-    return tools
-
-def build_agent_from_metadata(agent_id: str) -> Agent:
-    agent_data = fetch_agent_metadata(agent_id)
-    tool_data_list = fetch_tools_metadata(agent_data["tools"])
-    tools = build_tools_from_metadata(tool_data_list)
-    agent_config = fetch_agent_configs()
-
-    llm = LLM(model=agent_config["llm"])  if agent_config.get("llm") else None
-    function_calling_llm_config = LLM(model=agent_config["function_calling_llm"]) if agent_config.get("function_calling_llm") else None
-    agent = Agent(
-        config={
+def build_tools_from_metadata(tool_data_list: List[Dict[str, Any]], tool_ids: Optional[List[str]] = None) -> List["BaseTool"]:
+    """Tools of an agent from its api_metadata rows; each row version is parsed and validated once"""
+    return tool_registry.build_tools(tool_data_list, tool_ids)
+
+_llm_factory: Optional[Callable[..., Any]] = None
+
+
+def set_llm_factory(factory: Optional[Callable[..., Any]]) -> None:
+    """Replace how LLM objects are created (e.g. a stub LLM in benchmarks); None restores crewai.LLM"""
+    global _llm_factory
+    _llm_factory = factory
+    invalidate_agent_template()
+
+
+def make_llm(model: str, **kwargs: Any) -> Any:
+    """Create an LLM whose calls are answered from the completion cache or else rate limited per model"""
+    if _llm_factory is not None:
+        llm = _llm_factory(model, **kwargs)
+    else:
+        from crewai import LLM
+        llm = LLM(model=model, **kwargs)
+    # Cache outermost: a hit never waits for the limiter
+    return cache_llm(govern_llm(llm, model), model)
+
+
+AGENT_CACHE_TTL_SECONDS = float(os.getenv("AGENT_CACHE_TTL_SECONDS", "300"))
+AGENT_CACHE_MAX_SIZE = int(os.getenv("AGENT_CACHE_MAX_SIZE", "128"))
+
+
+class AgentTemplateCache:
+    """Process-wide LRU cache of built agent templates with TTL revalidation"""
+
+    def __init__(self, ttl_seconds: float, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for an agent (fresh or expired) and mark it recently used"""
+        with self._lock:
+            entry = self._entries.get(agent_id)
+            if entry is not None:
+                self._entries.move_to_end(agent_id)
+            return entry
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() - entry["validated_at"] < self.ttl_seconds
+
+    def put(self, agent_id: str, fingerprint: tuple, template: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[agent_id] = {
+                "fingerprint": fingerprint,
+                "template": template,
+                "validated_at": time.monotonic(),
+            }
+            self._entries.move_to_end(agent_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def touch(self, agent_id: str) -> None:
+        """Restart the TTL of an entry whose fingerprint was revalidated"""
+        with self._lock:
+            entry = self._entries.get(agent_id)
+            if entry is not None:
+                entry["validated_at"] = time.monotonic()
+
+    def record(self, outcome: str) -> None:
+        with self._lock:
+            if outcome == "hit":
+                self.hits += 1
+            elif outcome == "revalidated":
+                self.revalidations += 1
+            else:
+                self.misses += 1
+
+    def invalidate(self, agent_id: Optional[str] = None) -> int:
+        """Drop one agent's template, or every template when agent_id is None"""
+        with self._lock:
+            if agent_id is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                removed = 1 if self._entries.pop(agent_id, None) is not None else 0
+            self.invalidations += removed
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+agent_template_cache = AgentTemplateCache(AGENT_CACHE_TTL_SECONDS, AGENT_CACHE_MAX_SIZE)
+register_gauges("agent_template_cache", "Agent template cache counter", agent_template_cache.stats)
+register_gauges("tool_registry", "Compiled tool registry counter", tool_registry.stats)
+
+
+def _agent_fingerprint(agent_data: Dict[str, Any], agent_config: Dict[str, Any], tool_data_list: List[Dict[str, Any]]) -> tuple:
+    """Version key for a template: changes whenever the agent row, its config row or one of its tool rows changes"""
+    return (
+        content_version(agent_data),
+        content_version(agent_config),
+        tuple(sorted(content_version(row) for row in tool_data_list)),
+    )
+
+
+def build_agent_template(agent_data: Dict[str, Any], tool_data_list: List[Dict[str, Any]], agent_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the reusable, immutable part of one agent: its Agent config, tool specs and model names
+
+    Tool and LLM objects are not part of it: they keep per-run state, so every agent gets its own.
+    """
+    tool_specs = tuple(tool_registry.specs(tool_data_list, agent_data.get("tools")))
+    if agent_config.get("llm"):
+        # Agents are rebuilt per request, so crewai's per-instance max_rpm never applied across
+        # requests; it now seeds the shared limiter of the model instead
+        get_llm_limiter().set_default_rpm(agent_config["llm"], agent_config.get("max_rpm"), agent_config.get("id"))
+
+    config = {
         "role": agent_data["role"],
         "goal": agent_data["goal"],
         "backstory": agent_data["backstory"],
-        "tools": tools,
-        "llm": llm,
-        "function_calling_llm": function_calling_llm_config,
+        "tools": [],
+        "llm": None,
+        "function_calling_llm": None,
         "verbose": agent_config.get("verbose", False),
         "allow_delegation": agent_config.get("allow_delegation", False),
         "max_iter": agent_config.get("max_iter", 20),
-        "max_rpm": agent_config.get("max_rpm"),
+        "max_rpm": None,
         "max_execution_time": agent_config.get("max_execution_time"),
         "max_retry_limit": agent_config.get("max_retry_limit", 2),
         "allow_code_execution": agent_config.get("allow_code_execution", False),
@@ -102,9 +180,66 @@ def build_agent_from_metadata(agent_id: str) -> Agent:
         "step_callback": agent_config.get("step_callback"),
         "cache": agent_config.get("cache", True),
         "use_system_prompt": agent_config.get("use_system_prompt", True),
+    }
+    return {
+        "agent_config": config,
+        "tool_specs": tool_specs,
+        "llm": agent_config.get("llm") or None,
+        "function_calling_llm": agent_config.get("function_calling_llm") or None,
+    }
 
-        }
-    )
+
+def get_agent_template(agent_id: str) -> Dict[str, Any]:
+    """Return the cached template for an agent, rebuilding it only when missing or changed"""
+    entry = agent_template_cache.get(agent_id)
+    if entry is not None and agent_template_cache.is_fresh(entry):
+        agent_template_cache.record("hit")
+        return entry["template"]
+
+    with span("metadata_fetch", table="s_agent_basic_metadata"):
+        agent_data = fetch_agent_metadata(agent_id)
+    # From the in-memory snapshot: no round trip unless the agent's config was never loaded
+    agent_config = fetch_agent_configs(agent_data.get("config_id"))
+    # Tool rows are re-read too, so an edited URL, header or TTL reaches the next build
+    try:
+        with span("metadata_fetch", table="api_metadata"):
+            tool_data_list = fetch_tools_metadata(agent_data["tools"], raise_errors=entry is not None)
+    except Exception:
+        # Keep the last template rather than rebuild it without tools; retried on the next call
+        return entry["template"]
+    fingerprint = _agent_fingerprint(agent_data, agent_config, tool_data_list)
+
+    if entry is not None and entry["fingerprint"] == fingerprint:
+        agent_template_cache.touch(agent_id)
+        agent_template_cache.record("revalidated")
+        return entry["template"]
+
+    template = build_agent_template(agent_data, tool_data_list, agent_config)
+    agent_template_cache.put(agent_id, fingerprint, template)
+    agent_template_cache.record("miss")
+    return template
+
+
+def invalidate_agent_template(agent_id: Optional[str] = None) -> int:
+    """Drop cached templates so the next build re-reads metadata"""
+    return agent_template_cache.invalidate(agent_id)
+
+
+def build_agent_from_metadata(agent_id: str, stream: bool = False, step_callback: Optional[Callable[[Any], None]] = None) -> "Agent":
+    from crewai import Agent
+
+    instrument_llm_calls()
+    template = get_agent_template(agent_id)
+    config = dict(template["agent_config"])
+    # Fresh tool and LLM objects per agent, so concurrent runs never share their state
+    config["tools"] = [tool_registry.instantiate(spec) for spec in template["tool_specs"]]
+    if template["llm"]:
+        config["llm"] = make_llm(template["llm"], stream=True) if stream else make_llm(template["llm"])
+    if template["function_calling_llm"]:
+        config["function_calling_llm"] = make_llm(template["function_calling_llm"])
+    if step_callback is not None:
+        config["step_callback"] = step_callback
+    agent = Agent(config=config)
     return agent
 
 # agents = build_agent_from_metadata('4a95e784-0079-4adb-a579-d50e883076b5')
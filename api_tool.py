@@ -0,0 +1,101 @@
+# api_tool.py
+
+from crewai.tools import BaseTool
+from typing import Dict, Any, Optional
+from http_client import get_http_session, async_request, resolve_timeouts
+from metrics import span
+from inflight import check_cancelled
+import tool_cache
+
+
+class APICallTool(BaseTool):
+    name: str
+    description: str
+    endpoint_url: str
+    http_method: str
+    headers: Dict[str, Any] = None
+    query_params: Dict[str, Any] = None
+    body: Dict[str, Any] = None
+    connect_timeout: Optional[float] = None
+    read_timeout: Optional[float] = None
+    cache_ttl_seconds: Optional[float] = None
+
+    def _request_args(self) -> Dict[str, Any]:
+        headers = self.headers or {}
+        params = self.query_params or {}
+        data = self.body or {}
+
+        method = self.http_method.upper()
+        return {
+            "method": method,
+            "url": self.endpoint_url,
+            "headers": headers,
+            "params": params,
+            "json": data if method in ["POST", "PUT", "PATCH"] else None,
+            "data": data if method not in ["POST", "PUT", "PATCH"] and data else None,
+        }
+
+    def _run(self, **kwargs) -> str:
+        # Stops a cancelled task before it spends another API call
+        check_cancelled()
+        with span("tool_call", tool=self.name):
+            return self._call_sync()
+
+    async def _arun(self, **kwargs) -> str:
+        check_cancelled()
+        with span("tool_call", tool=self.name):
+            return await self._call_async()
+
+    def _call_sync(self) -> str:
+        try:
+            request_args = self._request_args()
+            key, entry = self._cached(request_args)
+            if entry is not None and entry.get("fresh"):
+                return entry["text"]
+
+            response = get_http_session().request(
+                timeout=resolve_timeouts(self.connect_timeout, self.read_timeout),
+                **request_args
+            )
+            return self._handle_response(response, key, entry)
+        except Exception as e:
+            return f"API call failed: {str(e)}"
+
+    async def _call_async(self) -> str:
+        try:
+            request_args = self._request_args()
+            key, entry = self._cached(request_args)
+            if entry is not None and entry.get("fresh"):
+                return entry["text"]
+
+            response = await async_request(
+                connect_timeout=self.connect_timeout,
+                read_timeout=self.read_timeout,
+                **request_args
+            )
+            return self._handle_response(response, key, entry)
+        except Exception as e:
+            return f"API call failed: {str(e)}"
+
+    def _cached(self, request_args: Dict[str, Any]):
+        """Look up an opt-in cached response; adds revalidation headers to request_args when stale"""
+        if not tool_cache.is_cacheable(request_args["method"], self.cache_ttl_seconds):
+            return None, None
+        body = request_args["json"] if request_args["json"] is not None else request_args["data"]
+        key = tool_cache.cache_key(request_args["method"], request_args["url"], request_args["params"], request_args["headers"], body)
+        entry, fresh = tool_cache.lookup(key)
+        if entry is None:
+            return key, None
+        if not fresh:
+            request_args["headers"] = {**request_args["headers"], **tool_cache.conditional_headers(entry)}
+        return key, dict(entry, fresh=fresh)
+
+    def _handle_response(self, response: Any, key: Optional[str], entry: Optional[Dict[str, Any]]) -> str:
+        if key is not None and entry is not None and response.status_code == 304:
+            tool_cache.refresh(key, entry, response, self.cache_ttl_seconds)
+            return entry["text"]
+
+        response.raise_for_status()
+        if key is not None:
+            tool_cache.store(key, response, self.cache_ttl_seconds)
+        return response.text
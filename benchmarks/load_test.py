@@ -0,0 +1,261 @@
+# benchmarks/load_test.py
+"""
+End-to-end load test of /process-task and /task-status, fully offline.
+
+The API runs in-process on the SQLite backend with a stub LLM and a local
+stub HTTP tool server, so only orchestration/agent-build overhead is measured.
+
+    python benchmarks/load_test.py --requests 200 --concurrency 20
+    python benchmarks/load_test.py --mode async --llm-latency-ms 200 --tool
+    python benchmarks/load_test.py --max-p95-ms 500 --json > bench_output.txt
+
+Exits non-zero when --max-p95-ms or --min-rps is not met.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Must be set before the app modules are imported
+os.environ.setdefault("DATA_BACKEND", "sqlite")
+os.environ.setdefault("PRELOAD_AGENT_RUNTIME", "0")
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+from agent_builder import set_llm_factory  # noqa: E402
+from repository import SQLiteRepository, set_repository  # noqa: E402
+from config_store import DEFAULT_AGENT_CONFIG_ID, fallback_agent_config  # noqa: E402
+from benchmarks.stubs import StubToolServer, stub_llm_factory  # noqa: E402
+
+AGENT_ID = "bench-agent"
+TOOL_ID = "bench-tool"
+TOOL_NAME = "cat_fact"
+CONFIG_ID = DEFAULT_AGENT_CONFIG_ID
+# execute_agent_task answers with this text instead of raising when the agent fails
+AGENT_ERROR = "Agent execution error"
+
+
+def seed(repo: SQLiteRepository, task_count: int, tool_url: str, use_tool: bool) -> list:
+    task_ids = [str(uuid.uuid4()) for _ in range(task_count)]
+    repo.insert_rows("s_tasks", [{"id": task_id, "task_status": "idle"} for task_id in task_ids])
+    repo.insert_rows("api_metadata", [{
+        "id": TOOL_ID,
+        "name": TOOL_NAME,
+        "tool_description": "Returns an interesting fact about cats",
+        "endpoint_url": tool_url,
+        "http_method": "GET",
+    }])
+    repo.insert_rows("s_agent_basic_metadata", [{
+        "id": AGENT_ID,
+        "role": "Benchmark assistant",
+        "goal": "Answer the user's question",
+        "backstory": "A deterministic agent used for load tests",
+        "tools": [TOOL_ID] if use_tool else [],
+    }])
+    # Every column set, as in production: NULL columns read back as None and fail Agent validation
+    config = {column: value for column, value in fallback_agent_config().items() if value is not None}
+    repo.insert_rows("s_agent_configs", [dict(config, id=CONFIG_ID, llm="stub/bench", max_iter=5, verbose=False)])
+    return task_ids
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ResourceSampler:
+    """Samples thread count and RSS of this process (server included) while the load runs"""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.threads = []
+        self.rss_mb = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.threads.append(threading.active_count())
+            self.rss_mb.append(_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "ResourceSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    # Nearest-rank percentile
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_one(client: httpx.AsyncClient, task_id: str, mode: str, poll_interval: float, request_timeout: float) -> tuple:
+    """(latency, status code) of one task; a failed agent run counts as 500, one that outlives request_timeout as 504"""
+    payload = {"task_id": task_id, "agent_id": AGENT_ID, "user_message": "Tell me something about cats", "mode": mode}
+    started = time.perf_counter()
+    try:
+        response = await client.post("/process-task", json=payload)
+    except httpx.TimeoutException:
+        return time.perf_counter() - started, 504
+    if mode == "async" and response.status_code == 202:
+        while time.perf_counter() - started < request_timeout:
+            await asyncio.sleep(poll_interval)
+            try:
+                status = await client.get(f"/task-status/{task_id}")
+            except httpx.TimeoutException:
+                break
+            if status.status_code != 200:
+                return time.perf_counter() - started, status.status_code
+            job_status = status.json().get("job_status")
+            if job_status == "completed":
+                failed = AGENT_ERROR in (status.json().get("agent_response") or "")
+                return time.perf_counter() - started, 500 if failed else 200
+            if job_status in ("failed", "cancelled"):
+                return time.perf_counter() - started, 500
+            if job_status is None:
+                # The job is gone: it will never finish
+                return time.perf_counter() - started, 404
+        return time.perf_counter() - started, 504
+    if response.status_code == 200 and AGENT_ERROR in response.text:
+        return time.perf_counter() - started, 500
+    return time.perf_counter() - started, response.status_code
+
+
+async def drive(base_url: str, task_ids: list, concurrency: int, mode: str, poll_interval: float, request_timeout: float) -> tuple:
+    limit = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async def worker(client: httpx.AsyncClient, task_id: str) -> None:
+        async with limit:
+            latency, status = await run_one(client, task_id, mode, poll_interval, request_timeout)
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == 200:
+            latencies.append(latency)
+
+    timeout = httpx.Timeout(request_timeout)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout,
+                                 limits=httpx.Limits(max_connections=concurrency * 2)) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, task_id) for task_id in task_ids))
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def start_server(port: int) -> uvicorn.Server:
+    from main import app
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    threading.Thread(target=server.run, name="bench-server", daemon=True).start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("server did not start")
+        time.sleep(0.01)
+    return server
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="Total /process-task calls (one task each)")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="Seconds between /task-status polls in async mode")
+    parser.add_argument("--request-timeout", type=float, default=120.0, help="Seconds before a request counts as failed (504)")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--llm-tokens", type=int, default=50)
+    parser.add_argument("--llm-ms-per-token", type=float, default=0.0)
+    parser.add_argument("--tool", action="store_true", help="Agent calls the stub HTTP tool once per run")
+    parser.add_argument("--tool-latency-ms", type=float, default=20.0)
+    parser.add_argument("--warmup", type=int, default=2, help="Requests sent before measuring")
+    parser.add_argument("--json", action="store_true", help="Print only the JSON report")
+    parser.add_argument("--max-p95-ms", type=float)
+    parser.add_argument("--min-rps", type=float)
+    args = parser.parse_args()
+
+    repo = SQLiteRepository()
+    set_repository(repo)
+    set_llm_factory(stub_llm_factory(args.llm_latency_ms, args.llm_tokens, args.llm_ms_per_token,
+                                     TOOL_NAME if args.tool else None))
+
+    with StubToolServer(args.tool_latency_ms) as tool_server:
+        task_ids = seed(repo, args.requests + args.warmup, tool_server.url, args.tool)
+        server = start_server(_free_port())
+        base_url = f"http://127.0.0.1:{server.config.port}"
+        try:
+            asyncio.run(drive(base_url, task_ids[:args.warmup], 1, args.mode, args.poll_interval, args.request_timeout))
+            threads_before = threading.active_count()
+            with ResourceSampler() as sampler:
+                latencies, statuses, elapsed = asyncio.run(
+                    drive(base_url, task_ids[args.warmup:], args.concurrency, args.mode, args.poll_interval, args.request_timeout)
+                )
+        finally:
+            server.should_exit = True
+
+        report = {
+            "config": vars(args),
+            "requests": args.requests,
+            "statuses": {str(code): count for code, count in sorted(statuses.items())},
+            "elapsed_s": round(elapsed, 3),
+            "rps": round(args.requests / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 2),
+                "p95": round(percentile(latencies, 95) * 1000, 2),
+                "p99": round(percentile(latencies, 99) * 1000, 2),
+                "mean": round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+                "max": round(max(latencies) * 1000, 2) if latencies else 0.0,
+            },
+            "threads": {"before": threads_before, "peak": max(sampler.threads, default=threads_before)},
+            "rss_mb": {"peak": round(max(sampler.rss_mb, default=_rss_mb()), 1), "end": round(_rss_mb(), 1)},
+            "tool_server_requests": tool_server.requests,
+        }
+
+    print(json.dumps(report, indent=None if args.json else 2))
+
+    failures = []
+    if statuses.get(200, 0) != args.requests:
+        failures.append(f"{args.requests - statuses.get(200, 0)} requests did not succeed")
+    if args.max_p95_ms is not None and report["latency_ms"]["p95"] > args.max_p95_ms:
+        failures.append(f"p95 {report['latency_ms']['p95']}ms > {args.max_p95_ms}ms")
+    if args.tool and tool_server.requests == 0:
+        failures.append("--tool set but the stub tool server received no requests")
+    if args.min_rps is not None and report["rps"] < args.min_rps:
+        failures.append(f"{report['rps']} rps < {args.min_rps} rps")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# benchmarks/stubs.py
+"""Deterministic stand-ins for the LLM provider and the HTTP APIs agents call."""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Union
+import json
+import threading
+import time
+
+from crewai import BaseLLM
+
+
+class StubLLM(BaseLLM):
+    """Answers after a fixed latency; optionally calls one tool first, ReAct style"""
+
+    def __init__(self, model: str, latency_ms: float = 50.0, tokens: int = 50,
+                 ms_per_token: float = 0.0, tool_name: Optional[str] = None, stream: bool = False, **kwargs: Any):
+        super().__init__(model=model)
+        self.latency_ms = latency_ms
+        self.tokens = tokens
+        self.ms_per_token = ms_per_token
+        self.tool_name = tool_name
+        self.stream = stream
+
+    def _emit_chunk(self, chunk: str) -> None:
+        from crewai.utilities.events import crewai_event_bus
+        from crewai.utilities.events.llm_events import LLMStreamChunkEvent
+        crewai_event_bus.emit(self, event=LLMStreamChunkEvent(chunk=chunk))
+
+    def call(self, messages: Union[str, List[Dict[str, str]]], tools: Optional[List[dict]] = None,
+             callbacks: Optional[List[Any]] = None, available_functions: Optional[Dict[str, Any]] = None,
+             **kwargs: Any) -> str:
+        time.sleep(self.latency_ms / 1000)
+        if self.tool_name and not self._observed_tool(messages):
+            return f"Thought: I should use the tool.\nAction: {self.tool_name}\nAction Input: {{}}"
+
+        words = [f"token{i}" for i in range(self.tokens)]
+        for word in words:
+            if self.ms_per_token:
+                time.sleep(self.ms_per_token / 1000)
+            if self.stream:
+                self._emit_chunk(word + " ")
+        return "Thought: I now know the final answer\nFinal Answer: " + " ".join(words)
+
+    def _observed_tool(self, messages: Union[str, List[Dict[str, str]]]) -> bool:
+        """Whether the tool already ran; crewai's own prompt mentions "Observation:" in its format instructions"""
+        if isinstance(messages, str):
+            return f"Action: {self.tool_name}\n" in messages
+        # The tool result comes back appended to the last message
+        return bool(messages) and "Observation:" in str(messages[-1].get("content", ""))
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def supports_stop_words(self) -> bool:
+        return True
+
+    def get_context_window_size(self) -> int:
+        return 128000
+
+
+def stub_llm_factory(latency_ms: float, tokens: int, ms_per_token: float = 0.0, tool_name: Optional[str] = None):
+    """agent_builder.set_llm_factory() callable producing StubLLM instances"""
+    def factory(model: str, **kwargs: Any) -> StubLLM:
+        return StubLLM(model, latency_ms=latency_ms, tokens=tokens, ms_per_token=ms_per_token,
+                       tool_name=tool_name, stream=kwargs.get("stream", False))
+    return factory
+
+
+class StubToolServer:
+    """Local HTTP server answering every GET with a small JSON body after a fixed delay"""
+
+    def __init__(self, latency_ms: float = 20.0, host: str = "127.0.0.1"):
+        latency = latency_ms / 1000
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                time.sleep(latency)
+                server.requests += 1
+                body = json.dumps({"fact": "Cats sleep for around 13 to 16 hours a day."}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f"http://{host}:{self._httpd.server_address[1]}/fact"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-tool-server", daemon=True)
+
+    def __enter__(self) -> "StubToolServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,158 @@
+# config_store.py
+
+from typing import Any, Dict, Optional, Set
+import os
+import threading
+import time
+from repository import get_repository
+from worker_pool import submit_io
+from metrics import span, register_gauges
+from logging_setup import get_logger
+
+logger = get_logger("config_store")
+
+# s_agent_configs row used by agents whose config_id is empty
+DEFAULT_AGENT_CONFIG_ID = os.getenv("DEFAULT_AGENT_CONFIG_ID", "dffeb172-175b-4ffb-bae1-17d0750167c1")
+# Age after which a snapshot is re-read in the background; it keeps being served meanwhile
+AGENT_CONFIG_REFRESH_SECONDS = float(os.getenv("AGENT_CONFIG_REFRESH_SECONDS", "60"))
+# LLM of the fallback config, used only while a config row cannot be read or does not exist
+AGENT_CONFIG_FALLBACK_LLM = os.getenv("AGENT_CONFIG_FALLBACK_LLM", "groq/llama-3.3-70b-versatile")
+
+# Minimum delay between reload attempts of a config that could not be read
+_RETRY_SECONDS = 5.0
+
+
+def fallback_agent_config() -> Dict[str, Any]:
+    """The one default config: used for a config row that is missing, or unreadable before its first load"""
+    return {
+        "llm": AGENT_CONFIG_FALLBACK_LLM,
+        "function_calling_llm": None,
+        "max_iter": 20,
+        "max_rpm": None,
+        "max_execution_time": None,
+        "verbose": False,
+        "allow_delegation": False,
+        "step_callback": None,
+        "cache": True,
+        "system_template": None,
+        "prompt_template": None,
+        "response_template": None,
+        "allow_code_execution": False,
+        "max_retry_limit": 2,
+        "respect_context_window": True,
+        "code_execution_mode": "safe",
+        "multimodal": False,
+        "inject_date": False,
+        "date_format": "%Y-%m-%d",
+        "reasoning": False,
+        "max_reasoning_attempts": None,
+        "embedder": None,
+        "knowledge_sources": None,
+        "user_system_prompt": None
+    }
+
+
+class ConfigSnapshotStore:
+    """In-memory snapshots of s_agent_configs rows, served stale while they are re-read in the background
+
+    A failed refresh keeps the last good snapshot, so a transient database error never
+    changes an agent's model; only a config never loaded falls back to the default.
+    """
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+        self._refreshing: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "loads": 0, "refreshes": 0, "refresh_failures": 0, "fallbacks": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _load(self, config_id: str) -> Dict[str, Any]:
+        """Read a config row into a snapshot; raises when the database cannot be read"""
+        with span("metadata_fetch", table="s_agent_configs"):
+            row = get_repository().get_agent_config(config_id)
+        if row is None:
+            logger.warning("Agent config not found, using the fallback config", extra={"fields": {"config_id": config_id}})
+            self._count("fallbacks")
+            return {"config": fallback_agent_config(), "source": "fallback", "loaded_at": time.monotonic()}
+        return {"config": row, "source": "database", "loaded_at": time.monotonic()}
+
+    def _store(self, config_id: str, snapshot: Dict[str, Any]) -> None:
+        with self._lock:
+            self._snapshots[config_id] = snapshot
+
+    def _refresh(self, config_id: str) -> None:
+        try:
+            self._store(config_id, self._load(config_id))
+            self._count("refreshes")
+        except Exception as e:
+            self._count("refresh_failures")
+            logger.warning("Agent config refresh failed, serving the last snapshot", extra={"fields": {
+                "config_id": config_id, "error": str(e)
+            }})
+            with self._lock:
+                snapshot = self._snapshots.get(config_id)
+                if snapshot is not None:
+                    # Retry after a short delay instead of on every request
+                    snapshot["loaded_at"] = time.monotonic() - self.refresh_seconds + _RETRY_SECONDS
+        finally:
+            with self._lock:
+                self._refreshing.discard(config_id)
+
+    def get(self, config_id: str) -> Dict[str, Any]:
+        """Config of config_id: the snapshot if there is one (refreshed in the background when due), else read now"""
+        with self._lock:
+            snapshot = self._snapshots.get(config_id)
+            due = snapshot is not None and time.monotonic() - snapshot["loaded_at"] >= self.refresh_seconds
+            if due and config_id not in self._refreshing:
+                self._refreshing.add(config_id)
+            else:
+                due = False
+            if snapshot is not None:
+                self._stats["hits"] += 1
+        if due:
+            submit_io(self._refresh, config_id)
+        if snapshot is not None:
+            return dict(snapshot["config"])
+
+        self._count("loads")
+        try:
+            snapshot = self._load(config_id)
+        except Exception as e:
+            logger.warning("Could not load agent config, using the fallback config", extra={"fields": {
+                "config_id": config_id, "error": str(e)
+            }})
+            self._count("fallbacks")
+            # Stored as due soon, so the real row replaces it once the database answers
+            snapshot = {
+                "config": fallback_agent_config(),
+                "source": "fallback",
+                "loaded_at": time.monotonic() - self.refresh_seconds + _RETRY_SECONDS
+            }
+        with self._lock:
+            snapshot = self._snapshots.setdefault(config_id, snapshot)
+        return dict(snapshot["config"])
+
+    def refresh(self, config_id: Optional[str] = None) -> int:
+        """Re-read one config, or every loaded one, now (e.g. from a change notification); returns how many"""
+        with self._lock:
+            config_ids = [config_id] if config_id is not None else list(self._snapshots)
+        for current in config_ids:
+            self._refresh(current)
+        return len(config_ids)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                self._stats,
+                size=len(self._snapshots),
+                fallback_snapshots=sum(1 for snapshot in self._snapshots.values() if snapshot["source"] == "fallback"),
+                refresh_seconds=self.refresh_seconds
+            )
+
+
+agent_config_store = ConfigSnapshotStore(AGENT_CONFIG_REFRESH_SECONDS)
+register_gauges("agent_configs", "Agent config snapshot counter", agent_config_store.stats)
@@ -1,133 +1,583 @@
-from supabase_client import supabase
-from typing import List, Dict, Any
+from repository import get_repository
+from typing import List, Dict, Any, Optional, Set, Tuple
 from fastapi import HTTPException
-from typing import Dict, Any
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import traceback
+from collections import OrderedDict
+import os
+import threading
+import time
+from datetime import datetime
+from logging_setup import get_logger
+from worker_pool import run_io
+from inflight import get_run
+from task_status import task_status_cache, TASK_STATUS_CACHE_TTL_SECONDS
+from write_behind import (
+    WriteBehindBuffer, WriteFailedError, WRITE_BEHIND_INTERVAL_SECONDS, WRITE_BEHIND_MAX_BATCH, WRITE_BEHIND_FLUSH_TIMEOUT_SECONDS
+)
+from metrics import register_gauges
+
+logger = get_logger("data_service_other")
+
+HISTORY_MODE = os.getenv("HISTORY_MODE", "incremental")
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "8000"))
+HISTORY_CACHE_MAX_TASKS = int(os.getenv("HISTORY_CACHE_MAX_TASKS", "1000"))
+# Optional s_tasks column holding a summary of turns that no longer fit the window
+HISTORY_SUMMARY_COLUMN = os.getenv("HISTORY_SUMMARY_COLUMN", "")
+
+_history_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_history_lock = threading.Lock()
+
+
+def _estimate_tokens(content: str) -> int:
+    # ~4 characters per token plus per-message overhead; close enough for budgeting
+    return len(content or "") // 4 + 4
+
+
+def _fetch_full_chat_history(task_id: str) -> List[Dict[str, str]]:
+    messages = []
+    for chat in get_repository().list_task_chats(task_id):
+        messages.append({
+            "role": chat["role"],
+            "content": chat["content"]
+        })
+    
+    return messages
+
+
+def _fetch_task_summary(task_id: str) -> Optional[str]:
+    if not HISTORY_SUMMARY_COLUMN:
+        return None
+    try:
+        task = get_repository().get_task(task_id, HISTORY_SUMMARY_COLUMN)
+        return (task or {}).get(HISTORY_SUMMARY_COLUMN) or None
+    except Exception as e:
+        logger.warning("Could not fetch history summary", extra={"fields": {"task_id": task_id, "error": str(e)}})
+        return None
+
+
+def _timestamp(value: str) -> datetime:
+    # Compared as datetimes: the database may format a timestamp differently from how it was written
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _at_watermark(created_at: str, entry: Dict[str, Any]) -> bool:
+    try:
+        return _timestamp(created_at) == _timestamp(entry["watermark"])
+    except (TypeError, ValueError):
+        return created_at == entry["watermark"]
+
+
+def _before_watermark(created_at: str, entry: Dict[str, Any]) -> bool:
+    if entry["watermark"] is None:
+        return False
+    try:
+        return _timestamp(created_at) < _timestamp(entry["watermark"])
+    except (TypeError, ValueError):
+        return True
+
+
+def _append_history_row(entry: Dict[str, Any], chat: Dict[str, Any]) -> None:
+    # Empty rows only move the watermark past them: they never make it into a window
+    if chat["content"]:
+        entry["rows"].append({"role": chat["role"], "content": chat["content"], "tokens": _estimate_tokens(chat["content"])})
+        # The summary is kept up to date along with the turns: re-read it once the tail has moved on
+        entry["summary_loaded"] = False
+    if entry["watermark"] is None or not _at_watermark(chat["created_at"], entry):
+        entry["watermark"] = chat["created_at"]
+        entry["seen_at_watermark"] = set()
+    entry["seen_at_watermark"].add(chat["id"])
+    entry["version"] += 1
+
+
+def _still_streaming(task_id: str, chat: Dict[str, Any]) -> bool:
+    """Whether an empty row is a response being streamed, rather than one left behind by an aborted stream"""
+    with _stream_buffers_lock:
+        if chat["id"] in _stream_buffers:
+            return True
+    # The running turn may not have streamed a token yet
+    run = get_run(task_id)
+    if run is None:
+        return False
+    try:
+        return _timestamp(chat["created_at"]).timestamp() >= run.started_at
+    except (TypeError, ValueError):
+        return True
+
+
+def _trim_history(entry: Dict[str, Any]) -> None:
+    # Keep only what a window could ever use
+    total = 0
+    keep = 0
+    for row in reversed(entry["rows"]):
+        total += row["tokens"]
+        keep += 1
+        if total > HISTORY_TOKEN_BUDGET:
+            break
+    if keep < len(entry["rows"]):
+        del entry["rows"][:len(entry["rows"]) - keep]
+        entry["truncated"] = True
+
+
+def _refresh_history_tail(task_id: str) -> Dict[str, Any]:
+    """Fetch only rows newer than the cached watermark and append them to the task's tail"""
+    while True:
+        with _history_lock:
+            entry = _history_cache.get(task_id)
+            if entry is None:
+                entry = {
+                    "rows": [], "watermark": None, "seen_at_watermark": set(), "version": 0, "held_back": False,
+                    "summary": None, "summary_loaded": False
+                }
+            _history_cache[task_id] = entry
+            _history_cache.move_to_end(task_id)
+            while len(_history_cache) > HISTORY_CACHE_MAX_TASKS:
+                _history_cache.popitem(last=False)
+            watermark = entry["watermark"]
+            version = entry["version"]
+
+        # gte + seen ids: rows sharing the watermark timestamp are not lost
+        rows = get_repository().list_task_chats(task_id, since=watermark)
+
+        with _history_lock:
+            if entry["version"] != version or _history_cache.get(task_id) is not entry:
+                # Rows were appended meanwhile (a flush or a concurrent refresh), or the tail was dropped: fetch again
+                continue
+            entry["held_back"] = False
+            for chat in rows:
+                if chat["id"] in entry["seen_at_watermark"]:
+                    continue
+                if not chat["content"] and _still_streaming(task_id, chat):
+                    # Stop here and pick the response up once it is complete
+                    entry["held_back"] = True
+                    break
+                _append_history_row(entry, chat)
+            _trim_history(entry)
+            return entry
+
+
+def _append_written_chats(rows: List[Dict[str, Any]]) -> None:
+    """Write-behind hook: extend the cached tails with the rows just flushed, instead of re-reading them"""
+    by_task: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        by_task.setdefault(row["task_id"], []).append(row)
+    with _history_lock:
+        for task_id, task_rows in by_task.items():
+            entry = _history_cache.get(task_id)
+            if entry is None:
+                continue
+            task_rows.sort(key=lambda row: row["created_at"])
+            # A row older than the watermark, or one the tail stops before, cannot simply be appended
+            if entry["held_back"] or any(_before_watermark(row["created_at"], entry) for row in task_rows):
+                _history_cache.pop(task_id, None)
+                continue
+            for row in task_rows:
+                if row["id"] not in entry["seen_at_watermark"]:
+                    _append_history_row(entry, row)
+            _trim_history(entry)
+
+
+def invalidate_task_history(task_id: str) -> None:
+    """Forget the cached tail of a task, e.g. after one of its rows was rewritten"""
+    with _history_lock:
+        _history_cache.pop(task_id, None)
+
 
 def fetch_task_chat_history(task_id: str) -> List[Dict[str, str]]:
-    """Fetch chat history for a task"""
-    try:
-        result = (
-            supabase.table("s_taskchats")
-            .select("role, content")
-            .eq("task_id", task_id)
-            .order("created_at", desc=False)
-            .execute()
-        )
-        
+    """Fetch chat history for a task, limited to the most recent HISTORY_TOKEN_BUDGET tokens"""
+    try:
+        # Read-your-writes: the previous turn may still be in the write-behind buffer
+        if _write_buffer is not None and _write_buffer.has_pending(task_id):
+            try:
+                _write_buffer.flush()
+            except WriteFailedError as e:
+                # Answer from what is stored rather than not at all
+                logger.warning("History read without the task's buffered writes", extra={"fields": {"task_id": task_id, "error": str(e)}})
+        if HISTORY_MODE != "incremental":
+            return _fetch_full_chat_history(task_id)
+
+        entry = _refresh_history_tail(task_id)
         messages = []
-        for chat in result.data:
-            messages.append({
-                "role": chat["role"],
-                "content": chat["content"]
-            })
+        used = 0
+        with _history_lock:
+            rows = list(entry["rows"])
+            truncated = entry.get("truncated", False)
+            summary, summary_loaded, version = entry["summary"], entry["summary_loaded"], entry["version"]
+        for row in reversed(rows):
+            if messages and used + row["tokens"] > HISTORY_TOKEN_BUDGET:
+                truncated = True
+                break
+            used += row["tokens"]
+            messages.append({"role": row["role"], "content": row["content"]})
+        messages.reverse()
+
+        if truncated:
+            if not summary_loaded:
+                summary = _fetch_task_summary(task_id)
+                with _history_lock:
+                    # A row appended during the read asks for the summary again
+                    if entry["version"] == version:
+                        entry["summary"] = summary
+                        entry["summary_loaded"] = True
+            if summary:
+                messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
         
+        logger.debug("Chat history window built", extra={"fields": {
+            "task_id": task_id, "messages": len(messages), "tokens": used, "truncated": truncated
+        }})
         return messages
     except Exception as e:
-        print(f"Warning: Could not fetch chat history: {str(e)}")
+        logger.warning("Could not fetch chat history", extra={"fields": {"task_id": task_id, "error": str(e)}})
         return []
 
-# print("started")
-# try:
-#     messages = fetch_task_chat_history('c412dcc3-82bd-4969-8d47-c92bfd5b9f64')
-#     print("Returned messages:", messages)
-# except Exception as e:
-#     print("Exception when fetching task chat history:", str(e))
-# print('hello')
+# Chat inserts and status updates of all tasks are written in bulk; None writes them one by one
+_write_buffer: Optional[WriteBehindBuffer] = (
+    WriteBehindBuffer(
+        WRITE_BEHIND_INTERVAL_SECONDS, WRITE_BEHIND_MAX_BATCH,
+        on_written=_append_written_chats, flush_timeout=WRITE_BEHIND_FLUSH_TIMEOUT_SECONDS
+    )
+    if WRITE_BEHIND_INTERVAL_SECONDS > 0 else None
+)
+if _write_buffer is not None:
+    register_gauges("write_behind", "Write-behind buffer counter", _write_buffer.stats)
 
 
 def insert_user_message(task_id: str, content: str) -> None:
     """Insert user message into s_taskchats"""
     try:
-        supabase.table("s_taskchats").insert({
-            "task_id": task_id,
-            "role": "user",
-            "content": content
-        }).execute()
+        if _write_buffer is not None:
+            _write_buffer.insert_chat(task_id, "user", content)
+        else:
+            get_repository().insert_task_chat(task_id, "user", content)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error inserting user message: {str(e)}")
     
 def insert_agent_response(task_id: str, content: str) -> None:
     """Insert agent response into s_taskchats"""
     try:
-        supabase.table("s_taskchats").insert({
-            "task_id": task_id,
-            "role": "assistant",
-            "content": content
-        }).execute()
+        if _write_buffer is not None:
+            _write_buffer.insert_chat(task_id, "assistant", content)
+        else:
+            get_repository().insert_task_chat(task_id, "assistant", content)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error inserting agent response: {str(e)}")
     
 def update_task_status(task_id: str, status: str) -> None:
     """Update task status in s_tasks table"""
     try:
-        supabase.table("s_tasks").update({"task_status": status}).eq("id", task_id).execute()
+        if _write_buffer is not None:
+            _write_buffer.update_status(task_id, status)
+        else:
+            get_repository().update_task_status(task_id, status)
     except Exception as e:
+        task_status_cache.forget(task_id)
         raise HTTPException(status_code=500, detail=f"Error updating task status: {str(e)}")
+    task_status_cache.set(task_id, status)
     
 
+def flush_task_writes(task_id: Optional[str] = None) -> None:
+    """Persist buffered writes before returning (strict consistency); raises 500 if task_id's writes failed"""
+    if _write_buffer is None:
+        return
+    try:
+        _write_buffer.flush(task_id)
+    except WriteFailedError as e:
+        # The cached status may never have reached storage
+        if task_id is not None:
+            task_status_cache.forget(task_id)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def close_write_buffer() -> None:
+    """Flush and stop the write-behind buffer (shutdown)"""
+    if _write_buffer is not None:
+        _write_buffer.close()
+
+
+def _log_claim_failure(task_id: str, error: Exception) -> None:
+    if isinstance(error, WriteFailedError):
+        logger.warning("Task not claimed: its buffered writes could not be flushed", extra={"fields": {
+            "task_id": task_id, "error": str(error)
+        }})
+
+
+def claim_task(task_id: str) -> Optional[Dict[str, Any]]:
+    """Atomically set task status to agent_processing unless it already is; returns the claimed row or None"""
+    try:
+        # A buffered status written after the claim would overwrite it, so no claim without the flush
+        if _write_buffer is not None and _write_buffer.has_pending(task_id):
+            _write_buffer.flush()
+        claimed = get_repository().claim_task(task_id)
+    except Exception as e:
+        _log_claim_failure(task_id, e)
+        raise HTTPException(status_code=500, detail=f"Error claiming task: {str(e)}")
+    if claimed is not None:
+        task_status_cache.set(task_id, "agent_processing")
+    return claimed
+
+
+def _cached_status(task_id: str) -> Optional[str]:
+    pending = _write_buffer.pending_status(task_id) if _write_buffer is not None else None
+    return pending if pending is not None else task_status_cache.get(task_id)
+
+
+def _fill_status(task_id: str, task: Optional[Dict[str, Any]], read_started: float) -> Tuple[bool, str]:
+    if task is None:
+        return False, "not_found"
+    status = task.get("task_status") or "idle"
+    task_status_cache.fill(task_id, status, read_started)
+    return True, status
+
+
+def get_task_state(task_id: str) -> Tuple[bool, str]:
+    """(exists, status) from the status cache, or from one query on a miss"""
+    status = _cached_status(task_id)
+    if status is not None:
+        return True, status
+    read_started = time.monotonic()
+    return _fill_status(task_id, get_repository().get_task(task_id, "id, task_status"), read_started)
+
+
 def get_task_status(task_id: str) -> str:
     """Get current task status"""
     try:
-        result = supabase.table("s_tasks").select("task_status").eq("id", task_id).single().execute()
-        if result.data:
-            return result.data.get("task_status", "idle")
-        return "idle"
+        exists, status = get_task_state(task_id)
+        return status if exists else "idle"
     except Exception:
         return "idle"
 
 def verify_task_exists(task_id: str) -> bool:
     """Verify if task exists"""
     try:
-        result = supabase.table("s_tasks").select("id").eq("id", task_id).single().execute()
-        return bool(result.data)
+        return get_task_state(task_id)[0]
     except Exception:
         return False    
+
+
+# Async variants for request handlers: same semantics, without blocking the event loop
+
+async def aclaim_task(task_id: str) -> Optional[Dict[str, Any]]:
+    """Async claim_task"""
+    try:
+        if _write_buffer is not None and _write_buffer.has_pending(task_id):
+            await run_io(_write_buffer.flush)
+        claimed = await get_repository().aclaim_task(task_id)
+    except Exception as e:
+        _log_claim_failure(task_id, e)
+        raise HTTPException(status_code=500, detail=f"Error claiming task: {str(e)}")
+    if claimed is not None:
+        task_status_cache.set(task_id, "agent_processing")
+    return claimed
+
+
+async def aclaim_tasks(task_ids: List[str]) -> List[str]:
+    """Claim many tasks in one statement; returns the ids that were claimed"""
+    try:
+        if _write_buffer is not None and any(_write_buffer.has_pending(task_id) for task_id in task_ids):
+            await run_io(_write_buffer.flush)
+        rows = await get_repository().aclaim_tasks(task_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error claiming tasks: {str(e)}")
+    claimed = [row["id"] for row in rows]
+    for task_id in claimed:
+        task_status_cache.set(task_id, "agent_processing")
+    return claimed
+
+
+async def afind_existing_tasks(task_ids: List[str]) -> Set[str]:
+    """Ids among task_ids that exist, in one query"""
+    try:
+        return {row["id"] for row in await get_repository().alist_tasks(task_ids, "id")}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error checking tasks: {str(e)}")
+
+
+async def aget_task_state(task_id: str) -> Tuple[bool, str]:
+    """Async get_task_state"""
+    status = _cached_status(task_id)
+    if status is not None:
+        return True, status
+    read_started = time.monotonic()
+    return _fill_status(task_id, await get_repository().aget_task(task_id, "id, task_status"), read_started)
+
+
+async def aget_task_status(task_id: str) -> str:
+    """Async get_task_status"""
+    try:
+        exists, status = await aget_task_state(task_id)
+        return status if exists else "idle"
+    except Exception:
+        return "idle"
+
+
+async def averify_task_exists(task_id: str) -> bool:
+    """Async verify_task_exists"""
+    try:
+        return (await aget_task_state(task_id))[0]
+    except Exception:
+        return False
+
+
+async def await_task_status_change(task_id: str, since: Optional[str], timeout: float) -> Tuple[bool, str]:
+    """(exists, status) once the status differs from `since` (the current one when None), or at the timeout"""
+    deadline = time.monotonic() + timeout
+    exists, status = await aget_task_state(task_id)
+    since = status if since is None else since
+    while exists and status == since:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        # Transitions written here wake the watcher at once; others are seen when the entry is revalidated
+        await task_status_cache.wait_for_change(task_id, status, min(remaining, TASK_STATUS_CACHE_TTL_SECONDS or 1.0))
+        exists, status = await aget_task_state(task_id)
+    return exists, status
+
+
+async def aupdate_task_status(task_id: str, status: str) -> None:
+    """Async update_task_status"""
+    try:
+        if _write_buffer is not None:
+            _write_buffer.update_status(task_id, status)
+        else:
+            await get_repository().aupdate_task_status(task_id, status)
+    except Exception as e:
+        task_status_cache.forget(task_id)
+        raise HTTPException(status_code=500, detail=f"Error updating task status: {str(e)}")
+    task_status_cache.set(task_id, status)
+
+
+async def ainsert_agent_response(task_id: str, content: str) -> None:
+    """Async insert_agent_response"""
+    try:
+        if _write_buffer is not None:
+            _write_buffer.insert_chat(task_id, "assistant", content)
+        else:
+            await get_repository().ainsert_task_chat(task_id, "assistant", content)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error inserting agent response: {str(e)}")
     
-import datetime
+STREAM_FLUSH_INTERVAL_SECONDS = float(os.getenv("STREAM_FLUSH_INTERVAL_MS", "250")) / 1000
+STREAM_FLUSH_BYTES = int(os.getenv("STREAM_FLUSH_BYTES", "2048"))
+
+
+class StreamBuffer:
+    """In-memory content of one streamed response; tokens are coalesced into periodic writes"""
+
+    def __init__(self, stream_id: str, task_id: Optional[str], content: str = ""):
+        self.stream_id = stream_id
+        self.task_id = task_id
+        self.parts = [content] if content else []
+        self.pending_bytes = 0
+        self.first_pending_at: float = 0.0
+        self.closed = False
+        self.state_lock = threading.Lock()
+        # Serialises DB writes so a late flush can never overwrite the final content
+        self.write_lock = threading.Lock()
+
+    def append(self, token: str) -> bool:
+        """Buffer a token; returns True when the size threshold asks for an immediate flush"""
+        with self.state_lock:
+            if not self.pending_bytes:
+                self.first_pending_at = time.monotonic()
+            self.parts.append(token)
+            self.pending_bytes += len(token.encode("utf-8"))
+            return self.pending_bytes >= STREAM_FLUSH_BYTES
+
+    def is_due(self, now: float) -> bool:
+        with self.state_lock:
+            return bool(self.pending_bytes) and (
+                self.pending_bytes >= STREAM_FLUSH_BYTES
+                or now - self.first_pending_at >= STREAM_FLUSH_INTERVAL_SECONDS
+            )
+
+    def flush(self) -> None:
+        """Write the whole buffered content in one UPDATE, without reading the row first"""
+        with self.write_lock:
+            with self.state_lock:
+                if self.closed or not self.pending_bytes:
+                    return
+                content = "".join(self.parts)
+                self.parts = [content]
+                self.pending_bytes = 0
+            get_repository().update_task_chat_content(self.stream_id, content)
+
+
+_stream_buffers: Dict[str, StreamBuffer] = {}
+_stream_buffers_lock = threading.Lock()
+_flush_wakeup = threading.Event()
+_flusher: Optional[threading.Thread] = None
+
+
+def _flush_loop() -> None:
+    while True:
+        _flush_wakeup.wait(STREAM_FLUSH_INTERVAL_SECONDS)
+        _flush_wakeup.clear()
+        now = time.monotonic()
+        with _stream_buffers_lock:
+            buffers = list(_stream_buffers.values())
+        for buffer in buffers:
+            if buffer.is_due(now):
+                try:
+                    buffer.flush()
+                except Exception as e:
+                    logger.warning("Stream flush failed", extra={"fields": {"stream_id": buffer.stream_id, "error": str(e)}})
+
+
+def _register_stream_buffer(stream_id: str, task_id: Optional[str], content: str = "") -> StreamBuffer:
+    global _flusher
+    with _stream_buffers_lock:
+        buffer = _stream_buffers.get(stream_id)
+        if buffer is None:
+            buffer = _stream_buffers[stream_id] = StreamBuffer(stream_id, task_id, content)
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="stream-flusher", daemon=True)
+            _flusher.start()
+        return buffer
+
 
 def create_streaming_chat_record(task_id: str) -> str:
     """Insert empty streaming response and return its row ID"""
     try:
-        result = supabase.table("s_taskchats").insert({
-            "task_id": task_id,
-            "role": "assistant",
-            "content": ""
-        }).execute()
-
-        inserted = result.data[0]
+        inserted = get_repository().insert_task_chat(task_id, "assistant", "")
+        _register_stream_buffer(inserted["id"], task_id)
         return inserted["id"]  # This becomes `stream_id`
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating stream record: {str(e)}")
 
 
 def update_streaming_content(stream_id: str, token: str) -> None:
-    """Append a token to the content of the agent's streaming response"""
+    """Append a token to the streamed response; it is written by the background flusher"""
     try:
-        # Fetch current content
-        result = supabase.table("s_taskchats").select("content").eq("id", stream_id).single().execute()
-        current_content = result.data["content"] if result.data else ""
+        with _stream_buffers_lock:
+            buffer = _stream_buffers.get(stream_id)
+        if buffer is None:
+            # Stream created elsewhere: seed the buffer from the row once
+            row = get_repository().get_task_chat(stream_id, "content, task_id") or {}
+            buffer = _register_stream_buffer(stream_id, row.get("task_id"), row.get("content") or "")
 
-        # Append token
-        updated_content = current_content + token
-
-        # Update in Supabase
-        supabase.table("s_taskchats").update({
-            "content": updated_content,
-            "updated_at": datetime.datetime.utcnow().isoformat()
-        }).eq("id", stream_id).execute()
+        if buffer.append(token):
+            _flush_wakeup.set()
     except Exception as e:
-        print(f"Stream update error: {e}")
+        logger.warning("Stream update failed", extra={"fields": {"stream_id": stream_id, "error": str(e)}})
 
 
 def complete_streaming_response(stream_id: str, full_response: str) -> None:
     """Overwrite the content with the final full agent response"""
+    with _stream_buffers_lock:
+        buffer = _stream_buffers.pop(stream_id, None)
     try:
-        supabase.table("s_taskchats").update({
-            "content": full_response,
-            "updated_at": datetime.datetime.utcnow().isoformat()
-        }).eq("id", stream_id).execute()
+        if buffer is None:
+            _write_final_content(stream_id, full_response)
+            return
+        # Waits for an in-flight flush, then discards pending tokens in favour of the final text
+        with buffer.write_lock:
+            with buffer.state_lock:
+                buffer.closed = True
+            _write_final_content(stream_id, full_response)
+        if buffer.task_id:
+            # The row may have been cached with partial content
+            invalidate_task_history(buffer.task_id)
     except Exception as e:
-        print(f"Stream finalize error: {e}")
\ No newline at end of file
+        logger.error("Stream finalize failed", extra={"fields": {"stream_id": stream_id, "error": str(e)}})
+
+
+def _write_final_content(stream_id: str, full_response: str) -> None:
+    get_repository().update_task_chat_content(stream_id, full_response)
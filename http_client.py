@@ -0,0 +1,94 @@
+# http_client.py
+
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import asyncio
+import os
+import threading
+import weakref
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_MAX_HOSTS = int(os.getenv("HTTP_MAX_HOSTS", "32"))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+
+def resolve_timeouts(connect_timeout: Optional[float], read_timeout: Optional[float]) -> Tuple[float, float]:
+    """Per-tool timeouts with the process defaults as fallback"""
+    return (
+        float(connect_timeout) if connect_timeout else HTTP_CONNECT_TIMEOUT,
+        float(read_timeout) if read_timeout else HTTP_READ_TIMEOUT,
+    )
+
+
+def get_http_session() -> requests.Session:
+    """Process-wide keep-alive session; the adapter pools at most HTTP_MAX_CONNECTIONS_PER_HOST sockets per host"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_MAX_HOSTS,
+                    pool_maxsize=HTTP_MAX_CONNECTIONS_PER_HOST,
+                    pool_block=True,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def _async_state() -> Dict[str, Any]:
+    # httpx.AsyncClient is bound to the loop it was first used on
+    loop = asyncio.get_running_loop()
+    state = _async_clients.get(loop)
+    if state is None:
+        state = {
+            "client": httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_HOSTS * HTTP_MAX_CONNECTIONS_PER_HOST,
+                    max_keepalive_connections=HTTP_MAX_HOSTS * HTTP_MAX_CONNECTIONS_PER_HOST,
+                ),
+            ),
+            "host_limits": {},
+        }
+        _async_clients[loop] = state
+    return state
+
+
+async def async_request(method: str, url: str, connect_timeout: Optional[float] = None,
+                        read_timeout: Optional[float] = None, **kwargs: Any) -> httpx.Response:
+    """Send a request on the loop's pooled client, at most HTTP_MAX_CONNECTIONS_PER_HOST at a time per host"""
+    state = _async_state()
+    host = urlsplit(url).netloc
+    limit = state["host_limits"].get(host)
+    if limit is None:
+        limit = state["host_limits"][host] = asyncio.Semaphore(HTTP_MAX_CONNECTIONS_PER_HOST)
+    connect, read = resolve_timeouts(connect_timeout, read_timeout)
+    async with limit:
+        return await state["client"].request(
+            method,
+            url,
+            timeout=httpx.Timeout(read, connect=connect),
+            **kwargs
+        )
+
+
+async def aclose_http_clients() -> None:
+    """Close the pooled clients (called from the FastAPI lifespan)"""
+    global _session
+    state = _async_clients.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+        await state["client"].aclose()
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
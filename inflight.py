@@ -0,0 +1,141 @@
+# inflight.py
+
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from contextlib import contextmanager
+import asyncio
+import threading
+import time
+
+# Events after which a run publishes nothing more
+TERMINAL_EVENTS = ("done", "error", "cancelled")
+
+_runs: Dict[str, "InFlightRun"] = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class TaskCancelledError(Exception):
+    """Raised inside an agent run once its task has been cancelled"""
+
+
+class InFlightRun:
+    """One executing task: its result, the events it published so far and its cancel flag
+
+    Created on the event loop; publish() may be called from any thread.
+    """
+
+    def __init__(self, task_id: str, agent_id: str, mode: str):
+        self.task_id = task_id
+        self.agent_id = agent_id
+        self.mode = mode
+        self.started_at = time.time()
+        self.attached = 0
+        self.cancel_requested = threading.Event()
+        self._loop = asyncio.get_running_loop()
+        self._result: "asyncio.Future[Dict[str, Any]]" = self._loop.create_future()
+        self._history: List[Tuple[str, Dict[str, Any]]] = []
+        self._subscribers: List["asyncio.Queue[Tuple[str, Dict[str, Any]]]"] = []
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        self._loop.call_soon_threadsafe(self._publish, event, data)
+
+    def _publish(self, event: str, data: Dict[str, Any]) -> None:
+        self._history.append((event, data))
+        for subscriber in self._subscribers:
+            subscriber.put_nowait((event, data))
+
+    async def events(self) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Replay everything published so far, then follow the run until a terminal event"""
+        subscriber: "asyncio.Queue[Tuple[str, Dict[str, Any]]]" = asyncio.Queue()
+        for item in self._history:
+            subscriber.put_nowait(item)
+        self._subscribers.append(subscriber)
+        try:
+            while True:
+                event, data = await subscriber.get()
+                yield event, data
+                if event in TERMINAL_EVENTS:
+                    break
+        finally:
+            self._subscribers.remove(subscriber)
+
+    def finish(self, result: Dict[str, Any]) -> None:
+        if not self._result.done():
+            self._result.set_result(result)
+
+    def fail(self, error: BaseException) -> None:
+        if not self._result.done():
+            self._result.set_exception(error)
+            # Attached callers re-raise it; nobody awaiting is not an error
+            self._result.exception()
+
+    async def wait(self) -> Dict[str, Any]:
+        """Result of the run; a disconnecting caller does not cancel it"""
+        return await asyncio.shield(self._result)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "task_id": self.task_id,
+            "agent_id": self.agent_id,
+            "mode": self.mode,
+            "started_at": self.started_at,
+            "attached": self.attached,
+            "cancel_requested": self.cancel_requested.is_set(),
+        }
+
+
+def start_run(task_id: str, agent_id: str, mode: str) -> Tuple[InFlightRun, bool]:
+    """Register a run for task_id, or return the one already executing; the flag is True when created"""
+    with _lock:
+        run = _runs.get(task_id)
+        if run is not None:
+            run.attached += 1
+            return run, False
+        run = _runs[task_id] = InFlightRun(task_id, agent_id, mode)
+        return run, True
+
+
+def end_run(run: InFlightRun) -> None:
+    """Forget a run so the next submission for its task starts a new one"""
+    with _lock:
+        if _runs.get(run.task_id) is run:
+            del _runs[run.task_id]
+
+
+def get_run(task_id: str) -> Optional[InFlightRun]:
+    with _lock:
+        return _runs.get(task_id)
+
+
+def cancel_run(task_id: str) -> Optional[InFlightRun]:
+    """Ask the run of a task to stop at its next step, token or tool call; None if nothing is running"""
+    run = get_run(task_id)
+    if run is not None:
+        run.cancel_requested.set()
+    return run
+
+
+def inflight_stats() -> Dict[str, int]:
+    with _lock:
+        return {
+            "running": len(_runs),
+            "attached": sum(run.attached for run in _runs.values()),
+            "cancelling": sum(1 for run in _runs.values() if run.cancel_requested.is_set()),
+        }
+
+
+@contextmanager
+def cancellable(run: Optional[InFlightRun]):
+    """Make check_cancelled() in this thread observe run's cancel flag"""
+    _local.run = run
+    try:
+        yield run
+    finally:
+        _local.run = None
+
+
+def check_cancelled() -> None:
+    """Raise TaskCancelledError if the run executing in this thread was cancelled"""
+    run = getattr(_local, "run", None)
+    if run is not None and run.cancel_requested.is_set():
+        raise TaskCancelledError(f"Task {run.task_id} was cancelled")
@@ -0,0 +1,192 @@
+# job_queue.py
+
+from typing import Any, Dict, List, Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# Shared by the web processes that enqueue and the `python -m worker` processes that run jobs
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "job_queue.db")
+# A running job whose worker stops renewing its lease for this long is handed to another worker
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+ACTIVE_STATUSES = ("queued", "running")
+JOB_STATUSES = ACTIVE_STATUSES + ("completed", "failed", "cancelled")
+
+
+class SqliteJobQueue:
+    """Durable FIFO of agent runs; claims are leased so jobs of a crashed worker are retried"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS agent_jobs ("
+            "id TEXT PRIMARY KEY, task_id TEXT NOT NULL, agent_id TEXT NOT NULL, user_message TEXT NOT NULL, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, cancel_requested INTEGER NOT NULL DEFAULT 0, "
+            "worker_id TEXT, lease_expires REAL, enqueued_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "agent_response TEXT, error TEXT, timing TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS agent_jobs_status ON agent_jobs (status, enqueued_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS agent_jobs_task ON agent_jobs (task_id, enqueued_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _decode(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["timing"] = json.loads(job["timing"]) if job["timing"] else None
+        return job
+
+    def _get(self, conn: sqlite3.Connection, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._decode(conn.execute("SELECT * FROM agent_jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def enqueue(self, task_id: str, agent_id: str, user_message: str) -> Dict[str, Any]:
+        conn = self._connect()
+        job_id = str(uuid.uuid4())
+        conn.execute(
+            "INSERT INTO agent_jobs (id, task_id, agent_id, user_message, status, enqueued_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+            (job_id, task_id, agent_id, user_message, time.time()),
+        )
+        return self._get(conn, job_id)
+
+    def latest_job(self, task_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT * FROM agent_jobs WHERE task_id = ? ORDER BY enqueued_at DESC LIMIT 1", (task_id,)
+        ).fetchone()
+        return self._decode(row)
+
+    def active_job(self, task_id: str) -> Optional[Dict[str, Any]]:
+        job = self.latest_job(task_id)
+        return job if job is not None and job["status"] in ACTIVE_STATUSES else None
+
+    def depth(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM agent_jobs WHERE status = 'queued'").fetchone()[0]
+
+    def claim(self, worker_id: str, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """Lease the oldest queued job, or a running one whose lease expired; None when idle"""
+        conn = self._connect()
+        now = time.time()
+        # BEGIN IMMEDIATE takes the write lock up front so two workers never pick the same row
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM agent_jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND lease_expires < ? AND attempts < ?) "
+                "ORDER BY enqueued_at LIMIT 1",
+                (now, JOB_MAX_ATTEMPTS),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE agent_jobs SET status = 'running', attempts = attempts + 1, worker_id = ?, "
+                "lease_expires = ?, started_at = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self._get(conn, row["id"])
+
+    def reap_expired(self) -> List[Dict[str, Any]]:
+        """Fail running jobs whose lease expired after their last allowed attempt; returns them"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM agent_jobs WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (time.time(), JOB_MAX_ATTEMPTS),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE agent_jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                [(time.time(), f"Worker lost after {row['attempts']} attempts", row["id"]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [self._decode(row) for row in rows]
+
+    def heartbeat(self, job_id: str, lease_seconds: float = JOB_LEASE_SECONDS) -> bool:
+        """Extend the lease of a running job; returns True once its cancellation was requested"""
+        conn = self._connect()
+        conn.execute(
+            "UPDATE agent_jobs SET lease_expires = ? WHERE id = ? AND status = 'running'",
+            (time.time() + lease_seconds, job_id),
+        )
+        row = conn.execute("SELECT cancel_requested FROM agent_jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def finish(self, job_id: str, status: str, agent_response: Optional[str] = None,
+               error: Optional[str] = None, timing: Optional[Dict[str, Any]] = None) -> None:
+        self._connect().execute(
+            "UPDATE agent_jobs SET status = ?, finished_at = ?, agent_response = ?, error = ?, timing = ?, "
+            "lease_expires = NULL WHERE id = ?",
+            (status, time.time(), agent_response, error, json.dumps(timing) if timing else None, job_id),
+        )
+
+    def request_cancel(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job outright or flag a running one for its worker; None if nothing is active"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, status FROM agent_jobs WHERE task_id = ? AND status IN ('queued', 'running') "
+                "ORDER BY enqueued_at DESC LIMIT 1",
+                (task_id,),
+            ).fetchone()
+            if row is not None:
+                if row["status"] == "queued":
+                    conn.execute(
+                        "UPDATE agent_jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? WHERE id = ?",
+                        (time.time(), row["id"]),
+                    )
+                else:
+                    conn.execute("UPDATE agent_jobs SET cancel_requested = 1 WHERE id = ?", (row["id"],))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self._get(conn, row["id"]) if row is not None else None
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM agent_jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+
+_queue: Optional[SqliteJobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> SqliteJobQueue:
+    """Open the queue file on first use so importing this module does no I/O"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = SqliteJobQueue(JOB_QUEUE_PATH)
+    return _queue
+
+
+def job_queue_in_use() -> bool:
+    """Whether this host has a queue file; lets status lookups skip creating one"""
+    return _queue is not None or os.path.exists(JOB_QUEUE_PATH)
@@ -0,0 +1,256 @@
+# llm_cache.py
+
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import functools
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from stream_events import current_sink
+from logging_setup import get_logger
+
+# "off" (default), "exact" (same model, messages and tools) or "similar" (exact, then embedding match)
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off")
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+# When set, completions are shared by every worker process on the host through this SQLite file
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")
+# Similar mode: sentence-transformers model and the cosine similarity a last message must reach
+LLM_CACHE_EMBEDDING_MODEL = os.getenv("LLM_CACHE_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+LLM_CACHE_SIMILARITY = float(os.getenv("LLM_CACHE_SIMILARITY", "0.95"))
+
+logger = get_logger("llm_cache")
+
+
+class MemoryLLMCache:
+    """In-process LRU store of completions, indexed by conversation context for similarity lookups"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires_at"] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def candidates(self, context_key: str) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            return [entry for entry in self._entries.values()
+                    if entry["context_key"] == context_key and entry.get("embedding") and entry["expires_at"] > now]
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SqliteLLMCache:
+    """Host-local store shared between worker processes; evicts least recently used rows"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, context_key TEXT NOT NULL, entry TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_context ON llm_cache (context_key)")
+        conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT entry FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def candidates(self, context_key: str) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT entry FROM llm_cache WHERE context_key = ? AND expires_at > ?", (context_key, time.time())
+        ).fetchall()
+        return [entry for entry in (json.loads(row[0]) for row in rows) if entry.get("embedding")]
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, context_key, entry, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, entry["context_key"], json.dumps(entry), entry["expires_at"], time.time()),
+        )
+        conn.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM llm_cache")
+
+    def size(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+_store: Any = None
+_store_lock = threading.Lock()
+_embedder: Any = None
+_embedder_lock = threading.Lock()
+_stats = {"hits": 0, "similar_hits": 0, "misses": 0, "stored": 0, "skipped": 0}
+_stats_lock = threading.Lock()
+
+
+def _get_store() -> Any:
+    """Open the backing store on first use so importing this module does no I/O"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SqliteLLMCache(LLM_CACHE_PATH, LLM_CACHE_MAX_ENTRIES) if LLM_CACHE_PATH else MemoryLLMCache(LLM_CACHE_MAX_ENTRIES)
+    return _store
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _digest(value: Any) -> str:
+    raw = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _as_messages(messages: Any) -> List[Dict[str, Any]]:
+    if isinstance(messages, str):
+        return [{"role": "user", "content": messages}]
+    return [{"role": message.get("role"), "content": message.get("content")} for message in messages]
+
+
+def cache_keys(model: str, messages: Any, tools: Optional[List[Dict[str, Any]]]) -> Tuple[str, str, str]:
+    """(exact key, context key, last message): the context is everything but the last message"""
+    messages = _as_messages(messages)
+    last = str(messages[-1]["content"]) if messages else ""
+    return _digest([model, messages, tools]), _digest([model, messages[:-1], tools]), last
+
+
+def _embed(text: str) -> Optional[List[float]]:
+    """Normalized sentence embedding, or None when sentence-transformers is not installed"""
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    _embedder = SentenceTransformer(LLM_CACHE_EMBEDDING_MODEL)
+                except ImportError:
+                    logger.warning("LLM_CACHE_MODE=similar needs sentence-transformers; using exact matches only")
+                    _embedder = False
+    if _embedder is False:
+        return None
+    return [float(value) for value in _embedder.encode(text, normalize_embeddings=True)]
+
+
+def _similar(context_key: str, embedding: List[float]) -> Optional[Dict[str, Any]]:
+    best, best_score = None, LLM_CACHE_SIMILARITY
+    for entry in _get_store().candidates(context_key):
+        # Embeddings are normalized, so the dot product is the cosine similarity
+        score = math.fsum(a * b for a, b in zip(embedding, entry["embedding"]))
+        if score >= best_score:
+            best, best_score = entry, score
+    return best
+
+
+def cache_llm(llm: Any, model: str) -> Any:
+    """Answer repeated calls of an LLM object from the completion cache (no-op when LLM_CACHE_MODE=off)"""
+    if LLM_CACHE_MODE not in ("exact", "similar"):
+        return llm
+    call = llm.call
+
+    @functools.wraps(call)
+    def cached_call(messages: Any, tools: Optional[List[Dict[str, Any]]] = None, *args: Any, **kwargs: Any) -> Any:
+        # With native function calling the LLM object runs the tools itself: never skip that
+        if kwargs.get("available_functions"):
+            _count("skipped")
+            return call(messages, tools, *args, **kwargs)
+
+        key, context_key, last_message = cache_keys(model, messages, tools)
+        entry = _get_store().get(key)
+        embedding = None
+        if entry is not None:
+            _count("hits")
+        elif LLM_CACHE_MODE == "similar":
+            embedding = _embed(last_message)
+            entry = _similar(context_key, embedding) if embedding else None
+            if entry is not None:
+                _count("similar_hits")
+        if entry is not None:
+            # A streaming run still gets the text, as one chunk
+            sink = current_sink()
+            if sink is not None:
+                sink.on_token(entry["response"])
+            return entry["response"]
+
+        _count("misses")
+        response = call(messages, tools, *args, **kwargs)
+        if isinstance(response, str) and response:
+            _get_store().set(key, {
+                "response": response,
+                "context_key": context_key,
+                "embedding": embedding,
+                "model": model,
+                "expires_at": time.time() + LLM_CACHE_TTL_SECONDS,
+            })
+            _count("stored")
+        return response
+
+    llm.call = cached_call
+    return llm
+
+
+def clear_llm_cache() -> None:
+    _get_store().clear()
+
+
+def llm_cache_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["similar_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["hits"] + stats["similar_hits"]) / lookups, 4) if lookups else 0.0
+    stats["mode"] = LLM_CACHE_MODE
+    stats["size"] = _get_store().size() if LLM_CACHE_MODE in ("exact", "similar") else 0
+    stats["max_entries"] = LLM_CACHE_MAX_ENTRIES
+    stats["backend"] = "sqlite" if LLM_CACHE_PATH else "memory"
+    return stats
@@ -0,0 +1,324 @@
+# llm_limiter.py
+
+from typing import Any, Deque, Dict, Optional, Tuple
+from collections import deque
+from contextlib import contextmanager
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from metrics import register_gauges
+from logging_setup import get_logger
+
+# Per-model limits, e.g. {"groq/llama-3.1-8b-instant": {"rpm": 30, "tpm": 6000}, "*": {"rpm": 500, "concurrency": 16}}
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "")
+# When set, buckets are shared by every process on the host through this SQLite file
+LLM_RATE_LIMIT_PATH = os.getenv("LLM_RATE_LIMIT_PATH")
+# Completion tokens reserved per call before the actual size is known
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "512"))
+# Every caller of a model pauses this long after the provider answers 429
+LLM_RATE_LIMIT_BACKOFF_SECONDS = float(os.getenv("LLM_RATE_LIMIT_BACKOFF_SECONDS", "5"))
+
+# Longest single sleep before a waiting caller re-reads the buckets
+_MAX_SLEEP_SECONDS = 1.0
+
+logger = get_logger("llm_limiter")
+
+Costs = Dict[str, Tuple[float, float]]
+
+
+def estimate_tokens(value: Any) -> int:
+    """~4 characters per token, like the chat history budget"""
+    if value is None:
+        return 0
+    if isinstance(value, list):
+        return sum(estimate_tokens(message.get("content") if isinstance(message, dict) else message) + 4 for message in value)
+    return len(str(value)) // 4 + 1
+
+
+def _refill(level: float, updated_at: float, per_minute: float, now: float) -> float:
+    return min(per_minute, level + (now - updated_at) * per_minute / 60)
+
+
+def _wait_for(costs: Costs, levels: Dict[str, float]) -> float:
+    """Seconds until every bucket holds its cost; 0 when they already do"""
+    wait = 0.0
+    for kind, (amount, per_minute) in costs.items():
+        amount = min(amount, per_minute)
+        if levels[kind] < amount:
+            wait = max(wait, (amount - levels[kind]) * 60 / per_minute)
+    return wait
+
+
+class MemoryBucketStore:
+    """Token buckets of this process; capacity is one minute of the limit"""
+
+    def __init__(self):
+        self._buckets: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self._paused_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _level(self, model: str, kind: str, per_minute: float, now: float) -> float:
+        level, updated_at = self._buckets.get((model, kind), (per_minute, now))
+        return _refill(level, updated_at, per_minute, now)
+
+    def take(self, model: str, costs: Costs) -> float:
+        """Debit every cost and return 0, or debit nothing and return the seconds to wait"""
+        now = time.time()
+        with self._lock:
+            paused = self._paused_until.get(model, 0.0) - now
+            if paused > 0:
+                return paused
+            levels = {kind: self._level(model, kind, per_minute, now) for kind, (_, per_minute) in costs.items()}
+            wait = _wait_for(costs, levels)
+            if wait == 0:
+                for kind, (amount, per_minute) in costs.items():
+                    self._buckets[(model, kind)] = (levels[kind] - min(amount, per_minute), now)
+            return wait
+
+    def charge(self, model: str, kind: str, amount: float, per_minute: float) -> None:
+        """Debit (or refund, when negative) without waiting; the level may go below zero"""
+        now = time.time()
+        with self._lock:
+            self._buckets[(model, kind)] = (self._level(model, kind, per_minute, now) - amount, now)
+
+    def pause(self, model: str, seconds: float) -> None:
+        with self._lock:
+            self._paused_until[model] = max(self._paused_until.get(model, 0.0), time.time() + seconds)
+
+
+class SqliteBucketStore:
+    """Host-local buckets shared between worker processes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS llm_buckets ("
+            "model TEXT NOT NULL, kind TEXT NOT NULL, level REAL NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (model, kind))"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _level(conn: sqlite3.Connection, model: str, kind: str, per_minute: float, now: float) -> float:
+        row = conn.execute("SELECT level, updated_at FROM llm_buckets WHERE model = ? AND kind = ?", (model, kind)).fetchone()
+        return _refill(row[0], row[1], per_minute, now) if row else per_minute
+
+    @staticmethod
+    def _store(conn: sqlite3.Connection, model: str, kind: str, level: float, now: float) -> None:
+        conn.execute("INSERT OR REPLACE INTO llm_buckets (model, kind, level, updated_at) VALUES (?, ?, ?, ?)", (model, kind, level, now))
+
+    def take(self, model: str, costs: Costs) -> float:
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT level FROM llm_buckets WHERE model = ? AND kind = 'paused_until'", (model,)).fetchone()
+            if row and row[0] > now:
+                return row[0] - now
+            levels = {kind: self._level(conn, model, kind, per_minute, now) for kind, (_, per_minute) in costs.items()}
+            wait = _wait_for(costs, levels)
+            if wait == 0:
+                for kind, (amount, per_minute) in costs.items():
+                    self._store(conn, model, kind, levels[kind] - min(amount, per_minute), now)
+            return wait
+
+    def charge(self, model: str, kind: str, amount: float, per_minute: float) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            self._store(conn, model, kind, self._level(conn, model, kind, per_minute, now) - amount, now)
+
+    def pause(self, model: str, seconds: float) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT level FROM llm_buckets WHERE model = ? AND kind = 'paused_until'", (model,)).fetchone()
+            self._store(conn, model, "paused_until", max(row[0] if row else 0.0, now + seconds), now)
+
+
+class LLMRateLimiter:
+    """Requests- and tokens-per-minute buckets per model; callers wait their turn in arrival order"""
+
+    def __init__(self, limits: Dict[str, Dict[str, float]], store: Any):
+        self._limits = dict(limits)
+        # max_rpm of agent configs per model, keyed by config id
+        self._config_rpm: Dict[str, Dict[str, float]] = {}
+        self._store = store
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, Deque[threading.Event]] = {}
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._stats = {"calls": 0, "throttled": 0, "wait_seconds": 0.0, "rate_limited": 0, "waiting": 0, "in_flight": 0}
+
+    def limits_for(self, model: str) -> Dict[str, float]:
+        """LLM_RATE_LIMITS entry of the model, else the "*" limits with the agent configs' rpm for the model"""
+        with self._lock:
+            if model in self._limits:
+                return self._limits[model]
+            limits = dict(self._limits.get("*") or {})
+            config_rpm = self._config_rpm.get(model)
+        if config_rpm:
+            limits["rpm"] = min(config_rpm.values())
+        return limits
+
+    def set_default_rpm(self, model: str, rpm: Optional[float], config_id: Optional[str] = None) -> None:
+        """Record an agent config's max_rpm for its model; the lowest one of all configs applies
+
+        Calling it again for a config replaces its previous value, and an empty rpm removes it.
+        """
+        with self._lock:
+            # A config that moved to another model no longer limits the old one
+            for current in list(self._config_rpm):
+                self._config_rpm[current].pop(str(config_id), None)
+                if not self._config_rpm[current]:
+                    del self._config_rpm[current]
+            if rpm:
+                self._config_rpm.setdefault(model, {})[str(config_id)] = float(rpm)
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def acquire(self, model: str, tokens: int) -> float:
+        """Block until the model's buckets allow one call of `tokens`; returns the seconds waited"""
+        limits = self.limits_for(model)
+        costs: Costs = {}
+        if limits.get("rpm"):
+            costs["rpm"] = (1, float(limits["rpm"]))
+        if limits.get("tpm"):
+            costs["tpm"] = (float(tokens), float(limits["tpm"]))
+        self._count("calls")
+        if not costs:
+            return 0.0
+
+        # FIFO turnstile: only the head of the queue polls the buckets, so callers
+        # are served in arrival order and a burst never stampedes the store
+        turn = threading.Event()
+        with self._lock:
+            queue = self._waiters.setdefault(model, deque())
+            queue.append(turn)
+            if len(queue) == 1:
+                turn.set()
+            self._stats["waiting"] += 1
+        started = time.monotonic()
+        throttled = False
+        try:
+            turn.wait()
+            while True:
+                wait = self._store.take(model, costs)
+                if wait <= 0:
+                    break
+                throttled = True
+                time.sleep(min(wait, _MAX_SLEEP_SECONDS))
+        finally:
+            with self._lock:
+                queue.remove(turn)
+                if queue:
+                    queue[0].set()
+                self._stats["waiting"] -= 1
+        waited = time.monotonic() - started
+        self._count("wait_seconds", waited)
+        if throttled:
+            self._count("throttled")
+        return waited
+
+    def settle(self, model: str, extra_tokens: int) -> None:
+        """Correct the tokens-per-minute bucket once the real completion size is known"""
+        tpm = self.limits_for(model).get("tpm")
+        if tpm and extra_tokens:
+            self._store.charge(model, "tpm", float(extra_tokens), float(tpm))
+
+    def backoff(self, model: str) -> None:
+        """Provider said 429: hold every caller of the model instead of letting each one retry"""
+        self._count("rate_limited")
+        self._store.pause(model, LLM_RATE_LIMIT_BACKOFF_SECONDS)
+        logger.warning("LLM provider rate limited", extra={"fields": {"model": model, "pause_seconds": LLM_RATE_LIMIT_BACKOFF_SECONDS}})
+
+    @contextmanager
+    def slot(self, model: str):
+        """Bound concurrent calls to a model when its limits set `concurrency`"""
+        concurrency = self.limits_for(model).get("concurrency")
+        semaphore = None
+        if concurrency:
+            with self._lock:
+                semaphore = self._slots.get(model)
+                if semaphore is None:
+                    semaphore = self._slots[model] = threading.BoundedSemaphore(int(concurrency))
+            semaphore.acquire()
+        self._count("in_flight")
+        try:
+            yield
+        finally:
+            self._count("in_flight", -1)
+            if semaphore is not None:
+                semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, wait_seconds=round(self._stats["wait_seconds"], 3), models=len(set(self._limits) | set(self._config_rpm)))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return (
+        getattr(error, "status_code", None) == 429
+        or "RateLimit" in type(error).__name__
+        or "rate limit" in str(error).lower()
+    )
+
+
+_limiter: Optional[LLMRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_llm_limiter() -> LLMRateLimiter:
+    """Process-wide limiter, created on first use so importing this module does no I/O"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                limits = json.loads(LLM_RATE_LIMITS) if LLM_RATE_LIMITS else {}
+                store = SqliteBucketStore(LLM_RATE_LIMIT_PATH) if LLM_RATE_LIMIT_PATH else MemoryBucketStore()
+                _limiter = LLMRateLimiter(limits, store)
+    return _limiter
+
+
+def govern_llm(llm: Any, model: str) -> Any:
+    """Route every call of an LLM object through the limiter of its model"""
+    limiter = get_llm_limiter()
+    call = llm.call
+
+    @functools.wraps(call)
+    def governed_call(messages: Any, *args: Any, **kwargs: Any) -> Any:
+        limiter.acquire(model, estimate_tokens(messages) + LLM_EXPECTED_COMPLETION_TOKENS)
+        with limiter.slot(model):
+            try:
+                response = call(messages, *args, **kwargs)
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    limiter.backoff(model)
+                raise
+        limiter.settle(model, estimate_tokens(response) - LLM_EXPECTED_COMPLETION_TOKENS)
+        return response
+
+    llm.call = governed_call
+    return llm
+
+
+register_gauges("llm_limiter", "LLM rate limiter counter", lambda: get_llm_limiter().stats())
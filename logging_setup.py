@@ -0,0 +1,125 @@
+# logging_setup.py
+
+from typing import Any, Dict, Optional
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" for structured lines, "text" for human-readable ones
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Fraction of DEBUG/INFO records kept; warnings and errors are never sampled out
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+# Longest message, field value or traceback written per record
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "2000"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+ROOT_LOGGER = "agent1"
+
+_configure_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_dropped = 0
+
+
+def truncate(value: Any, limit: int = LOG_MAX_FIELD_CHARS) -> Any:
+    """Bound the size of a logged value so a huge payload costs at most `limit` characters"""
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...[truncated {len(text) - limit} chars]"
+
+
+class _SamplingFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE
+
+
+class _BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Formats and truncates in the caller, then enqueues without ever blocking; drops when full"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = truncate(record.getMessage())
+        record.args = None
+        if record.exc_info:
+            # Keep the end of the traceback, where the error is
+            record.exc_text = logging.Formatter().formatException(record.exc_info)[-LOG_MAX_FIELD_CHARS:]
+            record.exc_info = None
+        fields = getattr(record, "fields", None)
+        if fields:
+            record.fields = {name: truncate(value) for name, value in fields.items()}
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{name}={value}" for name, value in fields.items())
+        return line
+
+
+def configure_logging() -> None:
+    """Route the app's loggers through a bounded queue drained by a background thread"""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(_JsonFormatter() if LOG_FORMAT == "json" else _TextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+        handler = _BoundedQueueHandler(log_queue)
+        handler.addFilter(_SamplingFilter())
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the app root; pass structured data as extra={"fields": {...}}
+
+    Records are only written once configure_logging() has run (the app lifespan does this).
+    """
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def dropped_log_records() -> int:
+    return _dropped
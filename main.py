@@ -1,26 +1,107 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict, Any, List, Literal
+from contextlib import asynccontextmanager
 import uvicorn
-from orchestrator import process_task_message
-from data_service_other import get_task_status, verify_task_exists
+from orchestrator import (
+    process_task_message, submit_task_message, enqueue_task_message, open_task_stream, open_task_batch, cancel_task_run,
+    WRITE_CONSISTENCY, BATCH_MAX_CONCURRENCY
+)
+from task_jobs import get_job
+from inflight import get_run, inflight_stats
+from job_queue import get_job_queue, job_queue_in_use, JOB_STATUSES
+from agent_builder import agent_template_cache, invalidate_agent_template
+from worker_pool import start_worker_pool, shutdown_worker_pool, get_worker_pool, shutdown_io_executor, run_io
+from http_client import aclose_http_clients
+from tool_cache import tool_cache_stats, clear_tool_cache
+from tool_registry import tool_registry
+from config_store import agent_config_store
+from llm_limiter import get_llm_limiter
+from llm_cache import llm_cache_stats, clear_llm_cache
+from metrics import render_prometheus, register_gauges
+from logging_setup import configure_logging, get_logger, dropped_log_records
+from data_service_other import aget_task_state, await_task_status_change, close_write_buffer
+from task_status import task_status_cache
+from supabase_client import init_supabase, aclose_async_supabase
+from repository import DATA_BACKEND
 import os
+import sys
+import threading
+
+logger = get_logger("main")
+
+# Import crewai in the background after startup so /health is ready before it loads
+PRELOAD_AGENT_RUNTIME = os.getenv("PRELOAD_AGENT_RUNTIME", "1") == "1"
+
+def _preload_agent_runtime():
+    try:
+        import api_tool  # noqa: F401  (pulls in crewai)
+        import crewai  # noqa: F401
+    except Exception as e:
+        logger.warning("Could not preload agent runtime", extra={"fields": {"error": str(e)}})
+
+register_gauges("worker_pool", "Shared agent worker pool counter", lambda: get_worker_pool().stats())
+register_gauges("tool_cache", "API tool response cache counter", tool_cache_stats)
+register_gauges("inflight", "Task executions running in this process", inflight_stats)
+register_gauges("llm_cache", "LLM completion cache counter", llm_cache_stats)
+register_gauges("logging", "Log records dropped because the log queue was full", lambda: {"dropped_records": dropped_log_records()})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    if DATA_BACKEND == "supabase":
+        init_supabase()
+    start_worker_pool()
+    if PRELOAD_AGENT_RUNTIME:
+        threading.Thread(target=_preload_agent_runtime, name="preload-agent-runtime", daemon=True).start()
+    yield
+    shutdown_worker_pool(wait=False)
+    shutdown_io_executor(wait=False)
+    await aclose_http_clients()
+    close_write_buffer()
+    await aclose_async_supabase()
 
 app = FastAPI(
     title="CrewAI Task Orchestration API",
     description="API for orchestrating CrewAI agents with task management",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 class TaskMessage(BaseModel):
     task_id: str
     agent_id: str
     user_message: str
+    mode: Literal["sync", "async", "queue"] = "sync"
+    # Defaults to WRITE_CONSISTENCY; "strict" persists the response before the run reports completion
+    consistency: Optional[Literal["strict", "eventual"]] = None
+
+class BatchTaskItem(BaseModel):
+    task_id: str
+    agent_id: str
+    user_message: str
+
+class TaskBatch(BaseModel):
+    tasks: List[BatchTaskItem]
+    # Items run at once; defaults to and is capped by BATCH_MAX_CONCURRENCY
+    concurrency: Optional[int] = None
+    consistency: Optional[Literal["strict", "eventual"]] = None
+
+# Largest batch accepted by /process-tasks
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
 
 class TaskStatusResponse(BaseModel):
     task_id: str
     status: str
     exists: bool
+    job_status: Optional[str] = None
+    job_id: Optional[str] = None
+    queue_depth: Optional[int] = None
+    agent_response: Optional[str] = None
+    error: Optional[str] = None
+    timing: Optional[Dict[str, Any]] = None
+    in_flight: bool = False
 
 @app.get("/")
 async def root():
@@ -30,92 +111,6 @@ async def root():
         "status": "running"
     }
 
-# from fastapi import HTTPException
-# from pydantic import BaseModel
-# from groq import AsyncGroq
-# import os
-# import asyncio
-# from supabase import create_client
-
-# # Supabase client
-# supabase = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"])
-
-# # Groq client
-# client = AsyncGroq(api_key=os.environ["GROQ_API_KEY"])
-
-# # class TaskMessage(BaseModel):
-# #     task_id: str
-# #     agent_id: str
-# #     user_message: str
-
-# @app.post("/process-task")
-# async def process_task(task_data: TaskMessage):
-#     try:
-#         # 1️⃣ Verify task exists
-#         task = supabase.table("s_tasks").select("*").eq("id", task_data.task_id).execute()
-#         if not task.data:
-#             raise HTTPException(status_code=404, detail="Task not found")
-
-#         # 2️⃣ Insert the user message
-#         supabase.table("s_taskchats").insert({
-#             "task_id": task_data.task_id,
-#             "task_prompt": task_data.user_message,
-#             "is_streaming": False,
-#             "stream_completed": True
-#         }).execute()
-
-#         # 3️⃣ Insert empty row for agent response
-#         agent_msg = supabase.table("s_taskchats").insert({
-#             "task_id": task_data.task_id,
-#             "task_prompt": None,
-#             "response": None,
-#             "partial_content": "",
-#             "is_streaming": True,
-#             "stream_completed": False
-#         }).execute()
-
-#         agent_msg_id = agent_msg.data[0]["id"]
-
-#         # 4️⃣ Stream tokens from Groq and update DB
-#         final_text = ""
-#         stream = await client.chat.completions.create(
-#             messages=[{"role": "user", "content": task_data.user_message}],
-#             model="llama3-8b-8192",
-#             stream=True
-#         )
-
-#         async for chunk in stream:
-#             token = chunk.choices[0].delta.content or ""
-#             if token:
-#                 final_text += token
-#                 supabase.table("s_taskchats").update({
-#                     "partial_content": final_text
-#                 }).eq("id", agent_msg_id).execute()
-
-#         # 5️⃣ Mark stream as completed and save final response
-#         supabase.table("s_taskchats").update({
-#             "response": final_text,
-#             "is_streaming": False,
-#             "stream_completed": True
-#         }).eq("id", agent_msg_id).execute()
-
-#         # 6️⃣ Update task status
-#         supabase.table("s_tasks").update({"task_status": "agent_responded"}).eq("id", task_data.task_id).execute()
-
-#         return {
-#             "success": True,
-#             "message": "Task processed successfully",
-#             "task_id": task_data.task_id,
-#             "status": "agent_responded",
-#             "agent_response": final_text
-#         }
-
-#     except HTTPException:
-#         raise
-#     except Exception as e:
-#         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-
-
 @app.post("/process-task")
 async def process_task(task_data: TaskMessage):
     """
@@ -124,12 +119,34 @@ async def process_task(task_data: TaskMessage):
     - **task_id**: ID of the task
     - **agent_id**: ID of the agent to use
     - **user_message**: Message from the user
+    - **mode**: `sync` waits for the agent response; `async` returns 202 immediately,
+      poll `/task-status/{task_id}` for progress and the final response; `queue` also returns
+      202 but hands the run to a separate `python -m worker` process through the durable job queue
+    
+    Resubmitting a task that is already running here attaches to that run instead of starting another.
     """
     try:
+        if task_data.mode == "queue":
+            queued = await enqueue_task_message(
+                task_id=task_data.task_id,
+                agent_id=task_data.agent_id,
+                user_message=task_data.user_message,
+                consistency=task_data.consistency or WRITE_CONSISTENCY
+            )
+            return JSONResponse(status_code=202, content=queued)
+        if task_data.mode == "async":
+            accepted = await submit_task_message(
+                task_id=task_data.task_id,
+                agent_id=task_data.agent_id,
+                user_message=task_data.user_message,
+                consistency=task_data.consistency or WRITE_CONSISTENCY
+            )
+            return JSONResponse(status_code=202, content=accepted)
         result = await process_task_message(
             task_id=task_data.task_id,
             agent_id=task_data.agent_id,
-            user_message=task_data.user_message
+            user_message=task_data.user_message,
+            consistency=task_data.consistency or WRITE_CONSISTENCY
         )
         return result
     except HTTPException:
@@ -137,72 +154,238 @@ async def process_task(task_data: TaskMessage):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.post("/stream-task")
+async def stream_task(task_data: TaskMessage):
+    """
+    Process a task message and stream the agent's output as Server-Sent Events
+    
+    Events: `queued`, `token`, `step`, `tool_started`, `tool_finished`, then `done`, `error` or `cancelled`.
+    The final text is persisted to the task chat like `/process-task`. A task already running here is
+    followed instead (`attached`, then a replay of its events so far).
+    """
+    try:
+        events = await open_task_stream(
+            task_id=task_data.task_id,
+            agent_id=task_data.agent_id,
+            user_message=task_data.user_message,
+            consistency=task_data.consistency or WRITE_CONSISTENCY
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Longest a /task-status/{task_id}/watch request is held open
+TASK_STATUS_WATCH_MAX_SECONDS = float(os.getenv("TASK_STATUS_WATCH_MAX_SECONDS", "30"))
+
+async def _task_status_response(task_id: str, exists: bool, status: str) -> TaskStatusResponse:
+    job = get_job(task_id)
+    if job is None and job_queue_in_use():
+        job = await run_io(get_job_queue().latest_job, task_id)
+    job = job or {}
+    return TaskStatusResponse(
+        task_id=task_id,
+        status=status,
+        exists=exists,
+        job_status=job.get("status"),
+        job_id=job.get("id"),
+        queue_depth=job.get("queue_depth"),
+        agent_response=job.get("agent_response"),
+        error=job.get("error"),
+        timing=job.get("timing"),
+        in_flight=get_run(task_id) is not None
+    )
+
+@app.get("/task-status-cache/stats")
+async def task_status_cache_stats():
+    """Hit/miss and transition counters of the task status cache"""
+    return task_status_cache.stats()
+
+@app.post("/process-tasks")
+async def process_tasks(batch: TaskBatch):
+    """
+    Process a batch of task messages, streaming one JSON line per task as each completes
+
+    Tasks are claimed in one bulk query and each agent is built once for the whole batch;
+    at most `concurrency` tasks run at a time. Each line is the `/process-task` result plus
+    `agent_id`, or `success: false` with the item's `status_code` and `detail`.
+
+    - **tasks**: `task_id`, `agent_id` and `user_message` of each task
+    - **concurrency**: Tasks run at once (default and maximum `BATCH_MAX_CONCURRENCY`)
+    - **consistency**: As for `/process-task`
+    """
+    if not batch.tasks:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(batch.tasks) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {BATCH_MAX_ITEMS} tasks")
+    try:
+        results = await open_task_batch(
+            [item.model_dump() for item in batch.tasks],
+            concurrency=batch.concurrency or BATCH_MAX_CONCURRENCY,
+            consistency=batch.consistency or WRITE_CONSISTENCY
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    return StreamingResponse(results, media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
 @app.get("/task-status/{task_id}")
 async def get_task_status_endpoint(task_id: str) -> TaskStatusResponse:
     """
     Get the current status of a task
     
+    Served from the status cache that this process's status updates write through to;
+    a miss costs one query.
+
     - **task_id**: ID of the task to check
     """
     try:
-        exists = verify_task_exists(task_id)
-        if exists:
-            status = get_task_status(task_id)
-        else:
-            status = "not_found"
-        
-        return TaskStatusResponse(
-            task_id=task_id,
-            status=status,
-            exists=exists
-        )
+        exists, status = await aget_task_state(task_id)
+        return await _task_status_response(task_id, exists, status)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error checking task status: {str(e)}")
 
+@app.get("/task-status/{task_id}/watch")
+async def watch_task_status(task_id: str, since: Optional[str] = None, timeout: float = TASK_STATUS_WATCH_MAX_SECONDS) -> TaskStatusResponse:
+    """
+    Long-poll the status of a task: respond as soon as it differs from `since`
+
+    Replaces polling `/task-status`: a transition made by this process answers at once,
+    one made elsewhere (e.g. a worker process) within `TASK_STATUS_CACHE_TTL_SECONDS`.
+    On timeout the unchanged status is returned; send it back as `since` to keep watching.
+
+    - **task_id**: ID of the task to watch
+    - **since**: Status the caller last saw (default: the current status)
+    - **timeout**: Seconds to wait, at most `TASK_STATUS_WATCH_MAX_SECONDS`
+    """
+    try:
+        exists, status = await await_task_status_change(
+            task_id, since, max(0.0, min(timeout, TASK_STATUS_WATCH_MAX_SECONDS))
+        )
+        return await _task_status_response(task_id, exists, status)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error watching task status: {str(e)}")
+
+@app.post("/cancel-task/{task_id}")
+async def cancel_task(task_id: str):
+    """
+    Cancel the running agent execution of a task
+
+    The run stops at its next agent step, streamed token or tool call (an LLM request
+    already in progress finishes first); its worker is then freed and the task status
+    becomes `cancelled`, so it can be submitted again. Queued jobs are cancelled outright;
+    a worker process notices cancellation of its running job when it next renews the lease.
+
+    - **task_id**: ID of the task to cancel
+    """
+    cancelled = await cancel_task_run(task_id)
+    if cancelled is None:
+        raise HTTPException(status_code=404, detail="No running execution for this task")
+    return {"success": True, **cancelled}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "message": "API is running"}
-
-# from fastapi import APIRouter, BackgroundTasks, HTTPException
-# from your_module import verify_task_exists, get_task_status, insert_user_message, update_task_status, run_streaming_agent_logic
-
-# router = APIRouter()
-
-# @router.post("/stream-task/")
-# async def process_task_message_streaming(
-#     task_id: str,
-#     agent_id: str,
-#     user_message: str,
-#     background_tasks: BackgroundTasks
-# ):
-#     """
-#     Starts background agent streaming for a task
-#     """
-#     try:
-#         if not verify_task_exists(task_id):
-#             raise HTTPException(status_code=404, detail="Task not found")
-
-#         if get_task_status(task_id) == "agent_processing":
-#             raise HTTPException(status_code=400, detail="Task already processing")
-
-#         insert_user_message(task_id, user_message)
-#         update_task_status(task_id, "agent_processing")
-
-#         # Launch background stream
-#         background_tasks.add_task(run_streaming_agent_logic, agent_id, task_id, user_message)
-
-#         return {
-#             "success": True,
-#             "message": "Streaming started",
-#             "task_id": task_id,
-#             "status": "agent_processing"
-#         }
-
-#     except Exception as e:
-#         update_task_status(task_id, "error")
-#         raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "healthy",
+        "message": "API is running",
+        "agent_runtime_loaded": "crewai" in sys.modules
+    }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus text exposition of stage latency histograms, counters and pool/cache gauges"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/worker-pool/stats")
+async def worker_pool_stats():
+    """Running/queued/rejected counters of the shared agent worker pool"""
+    return get_worker_pool().stats()
+
+@app.get("/job-queue/stats")
+async def job_queue_stats():
+    """Jobs on the durable queue by status"""
+    if not job_queue_in_use():
+        # No queue file on this host: nothing was ever queued, and none is created just to count
+        return {status: 0 for status in JOB_STATUSES}
+    return await run_io(lambda: get_job_queue().stats())
+
+@app.get("/llm-limiter/stats")
+async def llm_limiter_stats():
+    """Calls, throttling and provider 429 counters of the shared LLM rate limiter"""
+    return get_llm_limiter().stats()
+
+@app.get("/llm-cache/stats")
+async def llm_cache_stats_endpoint():
+    """Hit/miss counters and hit rate of the LLM completion cache"""
+    return llm_cache_stats()
+
+@app.delete("/llm-cache")
+async def clear_llm_cache_endpoint():
+    """Drop every cached LLM completion"""
+    clear_llm_cache()
+    return {"success": True}
+
+@app.get("/tool-cache/stats")
+async def tool_cache_stats_endpoint():
+    """Hit/miss counters for cached API tool responses"""
+    return tool_cache_stats()
+
+@app.delete("/tool-cache")
+async def clear_tool_cache_endpoint():
+    """Drop every cached API tool response"""
+    clear_tool_cache()
+    return {"success": True}
+
+@app.get("/tool-registry/stats")
+async def tool_registry_stats():
+    """Compiled tool spec counters, and the api_metadata rows rejected as invalid with the reason"""
+    return dict(tool_registry.stats(), invalid_tools=tool_registry.invalid_tools())
+
+@app.get("/agent-configs/stats")
+async def agent_config_stats():
+    """Snapshot counters of the agent config store"""
+    return agent_config_store.stats()
+
+@app.post("/agent-configs/refresh")
+async def refresh_agent_configs(config_id: Optional[str] = None):
+    """
+    Re-read agent configs now instead of at their next background refresh, e.g. from a database change hook
+
+    Cached agent templates are dropped so the next message of every agent uses the new config.
+
+    - **config_id**: Only this `s_agent_configs` row (default: every loaded config)
+    """
+    refreshed = await run_io(agent_config_store.refresh, config_id)
+    invalidate_agent_template()
+    return {"success": True, "refreshed": refreshed}
+
+@app.get("/agent-cache/stats")
+async def agent_cache_stats():
+    """Hit/miss counters for the compiled agent template cache"""
+    return agent_template_cache.stats()
+
+@app.delete("/agent-cache")
+async def invalidate_all_agent_templates():
+    """Drop every cached agent template"""
+    removed = invalidate_agent_template()
+    return {"success": True, "invalidated": removed}
+
+@app.delete("/agent-cache/{agent_id}")
+async def invalidate_agent_template_endpoint(agent_id: str):
+    """
+    Drop the cached template of one agent so its next message rebuilds it
+
+    - **agent_id**: ID of the agent whose metadata changed
+    """
+    removed = invalidate_agent_template(agent_id)
+    return {"success": True, "agent_id": agent_id, "invalidated": removed}
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
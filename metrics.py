@@ -0,0 +1,210 @@
+# metrics.py
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+import bisect
+import os
+import threading
+import time
+from logging_setup import get_logger
+
+logger = get_logger("metrics")
+
+# Export spans to the globally configured OpenTelemetry tracer when the SDK is installed
+OTEL_TRACES_ENABLED = os.getenv("OTEL_TRACES_ENABLED", "0") == "1"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series: Dict[LabelKey, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', repr(bound)))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+stage_duration = Histogram("agent_stage_duration_seconds", "Time spent in each stage of task processing")
+stage_errors = Counter("agent_stage_errors_total", "Stages that raised an exception")
+tasks_total = Counter("agent_tasks_total", "Processed tasks by outcome")
+
+_gauges: List[Tuple[str, str, Callable[[], Dict[str, Any]]]] = []
+
+
+def register_gauges(prefix: str, help_text: str, collect: Callable[[], Dict[str, Any]]) -> None:
+    """Expose the numeric values of a stats() dict as gauges named <prefix>_<key>"""
+    _gauges.append((prefix, help_text, collect))
+
+
+_tracer: Any = None
+if OTEL_TRACES_ENABLED:
+    try:
+        from opentelemetry import trace
+        _tracer = trace.get_tracer("agent1")
+    except ImportError:
+        logger.warning("OTEL_TRACES_ENABLED is set but opentelemetry is not installed")
+
+
+@contextmanager
+def span(stage: str, **labels: Any) -> Iterator[None]:
+    """Time a stage into agent_stage_duration_seconds (and an OpenTelemetry span when enabled)"""
+    otel_span = _tracer.start_as_current_span(stage, attributes={k: str(v) for k, v in labels.items()}) if _tracer else None
+    if otel_span is not None:
+        otel_span.__enter__()
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        stage_errors.inc(stage=stage, **labels)
+        if otel_span is not None:
+            otel_span.__exit__(type(e), e, e.__traceback__)
+            otel_span = None
+        raise
+    finally:
+        stage_duration.observe(time.perf_counter() - started, stage=stage, **labels)
+        if otel_span is not None:
+            otel_span.__exit__(None, None, None)
+
+
+def observe_stage(stage: str, seconds: float, **labels: Any) -> None:
+    """Record a duration measured elsewhere (e.g. queue wait reported by the worker pool)"""
+    stage_duration.observe(seconds, stage=stage, **labels)
+
+
+def timed(stage: str, fn: Callable[..., Any], **labels: Any) -> Callable[..., Any]:
+    """Wrap fn so each call is recorded as a stage; used for work submitted to other threads"""
+    def run(*args: Any, **kwargs: Any) -> Any:
+        with span(stage, **labels):
+            return fn(*args, **kwargs)
+    return run
+
+
+_llm_local = threading.local()
+_llm_lock = threading.Lock()
+_llm_instrumented = False
+
+
+def instrument_llm_calls() -> None:
+    """Time every LLM call through the CrewAI event bus (registered once, on first agent build)"""
+    global _llm_instrumented
+    with _llm_lock:
+        if _llm_instrumented:
+            return
+        try:
+            from crewai.utilities.events import crewai_event_bus
+            from crewai.utilities.events.llm_events import LLMCallStartedEvent, LLMCallCompletedEvent, LLMCallFailedEvent
+        except ImportError as e:
+            # Event bus of another crewai release: agents still run, only llm_call timings are missing
+            logger.warning("LLM call timing disabled, crewai event bus not found", extra={"fields": {"error": str(e)}})
+            _llm_instrumented = True
+            return
+
+        def model_of(source: Any, event: Any) -> str:
+            return str(getattr(event, "model", None) or getattr(source, "model", "unknown"))
+
+        # Handlers run in the calling thread, so a thread-local stack pairs start and end
+        @crewai_event_bus.on(LLMCallStartedEvent)
+        def _on_llm_started(source: Any, event: Any) -> None:
+            stack = getattr(_llm_local, "stack", None)
+            if stack is None:
+                stack = _llm_local.stack = []
+            stack.append(time.perf_counter())
+
+        def _finish(source: Any, event: Any, failed: bool) -> None:
+            stack = getattr(_llm_local, "stack", None)
+            if not stack:
+                return
+            model = model_of(source, event)
+            stage_duration.observe(time.perf_counter() - stack.pop(), stage="llm_call", model=model)
+            if failed:
+                stage_errors.inc(stage="llm_call", model=model)
+
+        @crewai_event_bus.on(LLMCallCompletedEvent)
+        def _on_llm_completed(source: Any, event: Any) -> None:
+            _finish(source, event, failed=False)
+
+        @crewai_event_bus.on(LLMCallFailedEvent)
+        def _on_llm_failed(source: Any, event: Any) -> None:
+            _finish(source, event, failed=True)
+
+        _llm_instrumented = True
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in (stage_duration, stage_errors, tasks_total):
+        lines.extend(metric.render())
+    for prefix, help_text, collect in _gauges:
+        try:
+            values = collect()
+        except Exception as e:
+            logger.warning("Could not collect metrics", extra={"fields": {"prefix": prefix, "error": str(e)}})
+            continue
+        for key, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{prefix}_{key}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,180 +1,518 @@
-from typing import List, Dict, Any
-from agent_builder import build_agent_from_metadata
+from typing import List, Dict, Any, Set, Optional, Callable, Tuple, AsyncIterator
+from agent_builder import build_agent_from_metadata, get_agent_template
 from data_service_other import (
     fetch_task_chat_history, 
-    insert_user_message, 
     insert_agent_response, 
     update_task_status,
-    get_task_status,
-    verify_task_exists,
+    aclaim_task,
+    aclaim_tasks,
+    afind_existing_tasks,
+    averify_task_exists,
+    ainsert_agent_response,
+    aupdate_task_status,
     create_streaming_chat_record,
     update_streaming_content,
-    complete_streaming_response
+    complete_streaming_response,
+    flush_task_writes
 )
+from worker_pool import AGENT_WORKERS, get_worker_pool, submit_io, run_io, PoolSaturatedError
+from task_jobs import create_job, update_job, get_job
+from inflight import InFlightRun, TaskCancelledError, start_run, end_run, cancel_run, cancellable, check_cancelled
+from job_queue import get_job_queue, job_queue_in_use
+from stream_events import TaskStreamSink, streaming_to
+from metrics import span, timed, observe_stage, tasks_total
+from logging_setup import get_logger
 from fastapi import HTTPException
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import traceback
+import json
+import os
+import time
 
-def execute_agent_task(agent_id: str, task_id: str, user_message: str) -> str:
-    """Execute agent task synchronously"""
+logger = get_logger("orchestrator")
+
+# "strict" persists a run's buffered writes before it reports completion; "eventual" leaves them to the write-behind flush
+WRITE_CONSISTENCY = os.getenv("WRITE_CONSISTENCY", "strict")
+# Items of one /process-tasks batch run at once at most (and by default)
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", str(AGENT_WORKERS)))
+
+def _step_callback(sink: Optional[TaskStreamSink]) -> Callable[[Any], None]:
+    def on_step(step_output: Any) -> None:
+        # Raising here ends kickoff at the next agent step once the task is cancelled
+        check_cancelled()
+        if sink is not None:
+            sink.step(step_output)
+    return on_step
+
+def execute_agent_task(agent_id: str, task_id: str, user_message: str, sink: Optional[TaskStreamSink] = None,
+                       run: Optional[InFlightRun] = None) -> str:
+    """Execute agent task synchronously, streaming tokens and steps to sink when given
+
+    Raises TaskCancelledError when run is cancelled; other errors are returned as the response text.
+    """
     try:
-        # Build agent from metadata
-        agent = build_agent_from_metadata(agent_id)
-        
-        # Get chat history and build messages
-        chat_history = fetch_task_chat_history(task_id)
-        
-        # If no history, use the user message directly
-        if not chat_history:
-            messages = user_message
-        else:
-            # Append new user message to history
-            chat_history.append({"role": "user", "content": user_message})
-            messages = chat_history
-        
-        # Execute agent with kickoff
-        result = agent.kickoff(messages)
-        
-        # Return raw output
-        return result.raw
-        
+        with cancellable(run):
+            # A run cancelled while queued gives its worker back immediately
+            check_cancelled()
+            
+            # Chat history does not depend on the agent: fetch it while the agent is built
+            history_future = submit_io(timed("history_fetch", fetch_task_chat_history), task_id)
+            
+            # Build agent from metadata
+            with span("agent_build"):
+                agent = build_agent_from_metadata(
+                    agent_id,
+                    stream=sink is not None,
+                    step_callback=_step_callback(sink)
+                )
+            
+            # Get chat history and build messages
+            chat_history = history_future.result()
+            
+            # If no history, use the user message directly
+            if not chat_history:
+                messages = user_message
+            else:
+                # Append new user message to history
+                chat_history.append({"role": "user", "content": user_message})
+                messages = chat_history
+            
+            # Execute agent with kickoff
+            check_cancelled()
+            with span("agent_run"):
+                if sink is None:
+                    result = agent.kickoff(messages)
+                else:
+                    with streaming_to(sink):
+                        result = agent.kickoff(messages)
+            
+            # Return raw output
+            return result.raw
+    
+    except TaskCancelledError:
+        raise
     except Exception as e:
+        if run is not None and run.cancel_requested.is_set():
+            # CrewAI may wrap the cancellation raised from a callback
+            raise TaskCancelledError(f"Task {task_id} was cancelled") from e
         error_msg = f"Agent execution error: {str(e)}"
-        print(f"Error in execute_agent_task: {error_msg}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Agent execution failed", extra={"fields": {"task_id": task_id, "agent_id": agent_id}})
         return error_msg
 
-async def process_task_message(task_id: str, agent_id: str, user_message: str) -> Dict[str, Any]:
-    """Process task message asynchronously"""
+async def admit_task(task_id: str) -> int:
+    """Reserve a worker slot and claim the task for processing; returns queue depth"""
+    # Reserve a worker slot before touching the task so a full queue leaves it untouched
+    pool = get_worker_pool()
+    try:
+        queue_depth = pool.admit()
+    except PoolSaturatedError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server busy: {str(e)}",
+            headers={"Retry-After": "5", "X-Queue-Depth": str(e.queue_depth)}
+        )
     
     try:
-        # Verify task exists
-        if not verify_task_exists(task_id):
+        await claim_or_reject(task_id)
+    except Exception:
+        pool.release()
+        raise
+    return queue_depth
+
+async def claim_or_reject(task_id: str) -> None:
+    """Claim the task for processing; raises 404 if it does not exist, 400 if it is already processing"""
+    # Single conditional update: exists and not already processing -> agent_processing
+    with span("admission"):
+        claimed = await aclaim_task(task_id)
+    if claimed is None:
+        # Only the rejection path pays for telling "missing" and "busy" apart
+        if not await averify_task_exists(task_id):
             raise HTTPException(status_code=404, detail="Task not found")
+        raise HTTPException(status_code=400, detail="Task is already being processed")
+
+def record_task_failure(task_id: str, error: Exception) -> str:
+    """Mark a task as errored after an unexpected failure; returns the error message"""
+    error_msg = f"Error processing task: {str(error)}"
+    tasks_total.inc(outcome="error")
+    
+    try:
+        # Try to update task status to error
+        update_task_status(task_id, "error")
+        # Insert error message as agent response
+        insert_agent_response(task_id, f"Error: {error_msg}")
+    except:
+        pass  # If we can't update status, just continue
+    
+    logger.error(
+        "Task processing failed",
+        exc_info=(type(error), error, error.__traceback__),
+        extra={"fields": {"task_id": task_id}}
+    )
+    return error_msg
+
+def record_task_cancelled(task_id: str, record: Optional[Dict[str, Any]] = None) -> None:
+    """Release a cancelled task so it can be submitted again, keeping any partially streamed text"""
+    tasks_total.inc(outcome="cancelled")
+    try:
+        if record is not None and record["stream_id"] is not None:
+            complete_streaming_response(record["stream_id"], "".join(record["chunks"]))
+        update_task_status(task_id, "cancelled")
+    except Exception as e:
+        logger.warning("Could not record cancellation", extra={"fields": {"task_id": task_id, "error": str(e)}})
+    logger.info("Task cancelled", extra={"fields": {"task_id": task_id}})
+
+_background_runs: Set["asyncio.Task[None]"] = set()
+
+def _launch(coro: Any) -> None:
+    # Runs outlive the request that started them; keep a reference until they finish
+    task = asyncio.create_task(coro)
+    _background_runs.add(task)
+    task.add_done_callback(_background_runs.discard)
+
+async def _flush_writes(task_id: str, consistency: str) -> None:
+    if consistency == "strict":
+        await run_io(flush_task_writes, task_id)
+
+async def _flush_failure_writes(task_id: str, consistency: str) -> None:
+    try:
+        await _flush_writes(task_id, consistency)
+    except Exception as e:
+        logger.warning("Could not persist failure writes", extra={"fields": {"task_id": task_id, "error": str(e)}})
+
+async def _execute_run(run: InFlightRun, user_message: str, queue_depth: int,
+                       sink: Optional[TaskStreamSink] = None, record: Optional[Dict[str, Any]] = None,
+                       on_start: Optional[Callable[[], None]] = None, consistency: str = WRITE_CONSISTENCY) -> None:
+    """Run an admitted task on the shared worker pool, persist its response and settle the run"""
+    task_id = run.task_id
+    try:
+        # Execute agent task on the shared worker pool to avoid blocking
+        agent_response, timing = await get_worker_pool().run_admitted(
+            queue_depth,
+            execute_agent_task,
+            run.agent_id,
+            task_id,
+            user_message,
+            sink,
+            run,
+            on_start=on_start
+        )
+        observe_stage("queue_wait", timing["queue_wait_ms"] / 1000)
         
-        # Check if task is already being processed
-        current_status = get_task_status(task_id)
-        if current_status == "agent_processing":
-            raise HTTPException(status_code=400, detail="Task is already being processed")
-        
-        # Insert user message
-        # insert_user_message(task_id, user_message)
-        
-        # Update task status to processing
-        update_task_status(task_id, "agent_processing")
-        
-        # Execute agent task in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        with ThreadPoolExecutor() as executor:
-            agent_response = await loop.run_in_executor(
-                executor, 
-                execute_agent_task, 
-                agent_id, 
-                task_id, 
-                user_message
-            )
-        
-        # Insert agent response
-        insert_agent_response(task_id, agent_response)
+        # Persist the final text into the streamed row (or a new row if nothing was streamed)
+        with span("response_insert"):
+            if record is None or record["stream_id"] is None:
+                await ainsert_agent_response(task_id, agent_response)
+            else:
+                await run_io(complete_streaming_response, record["stream_id"], agent_response)
         
         # Update task status to responded
-        update_task_status(task_id, "agent_responded")
+        with span("status_update"):
+            await aupdate_task_status(task_id, "agent_responded")
+            await _flush_writes(task_id, consistency)
+        tasks_total.inc(outcome="responded")
         
-        return {
+        result = {
             "success": True,
             "message": "Task processed successfully",
             "task_id": task_id,
             "status": "agent_responded",
-            "agent_response": agent_response
+            "agent_response": agent_response,
+            "timing": timing
         }
-        
-    except HTTPException:
-        # Re-raise HTTP exceptions
-        raise
+        end_run(run)
+        run.publish("done", result)
+        run.finish(result)
+    except TaskCancelledError:
+        await run_io(record_task_cancelled, task_id, record)
+        await _flush_failure_writes(task_id, consistency)
+        end_run(run)
+        run.publish("cancelled", {"task_id": task_id, "status": "cancelled"})
+        run.fail(HTTPException(status_code=409, detail="Task was cancelled"))
     except Exception as e:
-        # Handle any other errors
-        error_msg = f"Error processing task: {str(e)}"
-        
+        error_msg = await run_io(record_task_failure, task_id, e)
+        await _flush_failure_writes(task_id, consistency)
+        end_run(run)
+        run.publish("error", {"task_id": task_id, "status": "error", "detail": error_msg})
+        run.fail(HTTPException(status_code=500, detail=error_msg))
+
+async def _admit_run(run: InFlightRun) -> int:
+    """Admit the task of a newly registered run; attached callers see the same rejection"""
+    try:
+        return await admit_task(run.task_id)
+    except Exception as e:
+        end_run(run)
+        run.fail(e)
+        raise
+
+async def process_task_message(task_id: str, agent_id: str, user_message: str,
+                               consistency: str = WRITE_CONSISTENCY) -> Dict[str, Any]:
+    """Process task message asynchronously; a task already running here is awaited instead of re-run"""
+    run, created = start_run(task_id, agent_id, "sync")
+    if not created:
+        return dict(await run.wait(), deduplicated=True)
+    
+    queue_depth = await _admit_run(run)
+    _launch(_execute_run(run, user_message, queue_depth, consistency=consistency))
+    return await run.wait()
+
+async def _track_job(run: InFlightRun) -> None:
+    try:
+        result = await run.wait()
+        update_job(
+            run.task_id,
+            status="completed",
+            finished_at=time.time(),
+            agent_response=result["agent_response"],
+            timing=result["timing"]
+        )
+    except HTTPException as e:
+        update_job(
+            run.task_id,
+            status="cancelled" if e.status_code == 409 else "failed",
+            finished_at=time.time(),
+            error=e.detail
+        )
+
+async def submit_task_message(task_id: str, agent_id: str, user_message: str,
+                              consistency: str = WRITE_CONSISTENCY) -> Dict[str, Any]:
+    """Admit a task and run it in the background; progress is reported through the job registry"""
+    run, created = start_run(task_id, agent_id, "async")
+    if not created:
+        job = get_job(task_id) or {}
+        return {
+            "success": True,
+            "message": "Task is already running",
+            "task_id": task_id,
+            "status": "agent_processing",
+            "job_status": job.get("status", "running"),
+            "queue_depth": job.get("queue_depth"),
+            "deduplicated": True
+        }
+    
+    queue_depth = await _admit_run(run)
+    job = create_job(task_id, agent_id, queue_depth)
+    _launch(_track_job(run))
+    _launch(_execute_run(
+        run, user_message, queue_depth,
+        on_start=lambda: update_job(task_id, status="running", started_at=time.time()),
+        consistency=consistency
+    ))
+    return {
+        "success": True,
+        "message": "Task accepted",
+        "task_id": task_id,
+        "status": "agent_processing",
+        "job_status": job["status"],
+        "queue_depth": queue_depth
+    }
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def enqueue_task_message(task_id: str, agent_id: str, user_message: str,
+                               consistency: str = WRITE_CONSISTENCY) -> Dict[str, Any]:
+    """Claim a task and put it on the durable job queue for a `python -m worker` process"""
+    queue = get_job_queue()
+    job = await run_io(queue.active_job, task_id)
+    if job is None:
+        # The claim and the worker read the task from storage: neither may miss writes still buffered here
+        await _flush_writes(task_id, consistency)
+        await claim_or_reject(task_id)
+        job = await run_io(queue.enqueue, task_id, agent_id, user_message)
+        message, deduplicated = "Task queued", False
+    else:
+        message, deduplicated = "Task is already queued", True
+    return {
+        "success": True,
+        "message": message,
+        "task_id": task_id,
+        "status": "agent_processing",
+        "job_id": job["id"],
+        "job_status": job["status"],
+        "queue_depth": await run_io(queue.depth),
+        "deduplicated": deduplicated
+    }
+
+def start_claimed_task(task_id: str, agent_id: str, user_message: str, mode: str,
+                       consistency: str = WRITE_CONSISTENCY) -> InFlightRun:
+    """Run a task claimed elsewhere (e.g. taken off the job queue) on this process's worker pool"""
+    run, created = start_run(task_id, agent_id, mode)
+    if created:
         try:
-            # Try to update task status to error
-            update_task_status(task_id, "error")
-            # Insert error message as agent response
-            insert_agent_response(task_id, f"Error: {error_msg}")
-        except:
-            pass  # If we can't update status, just continue
-        
-        print(f"Error in process_task_message: {error_msg}")
-        print(f"Traceback: {traceback.format_exc()}")
-        
-        raise HTTPException(status_code=500, detail=error_msg)
-
-
-# async def process_task_message(task_id: str, agent_id: str, user_message: str) -> Dict[str, Any]:
-#     """Process task message asynchronously with streaming support"""
-
-#     try:
-#         # 1. Verify task exists
-#         if not verify_task_exists(task_id):
-#             raise HTTPException(status_code=404, detail="Task not found")
-
-#         # 2. Check if task is already being processed
-#         current_status = get_task_status(task_id)
-#         if current_status == "agent_processing":
-#             raise HTTPException(status_code=400, detail="Task is already being processed")
-
-#         # 3. Insert user message
-#         insert_user_message(task_id, user_message)
-
-#         # 4. Create streaming record
-#         stream_id = create_streaming_chat_record(task_id)
-
-#         # 5. Update task status
-#         update_task_status(task_id, "agent_processing")
-
-#         # 6. Define stream callback
-#         def stream_callback(token: str):
-#             try:
-#                 update_streaming_content(stream_id, token)
-#             except Exception as e:
-#                 print(f"Stream callback error: {e}")
-
-#         # 7. Execute agent task with streaming
-#         loop = asyncio.get_event_loop()
-#         with ThreadPoolExecutor() as executor:
-#             agent_response = await loop.run_in_executor(
-#                 executor,
-#                 execute_agent_task,
-#                 agent_id,
-#                 task_id,
-#                 user_message,
-#                 stream_callback  # <-- pass callback
-#             )
-
-#         # 8. Final response insert
-#         complete_streaming_response(stream_id, agent_response)
-#         insert_agent_response(task_id, agent_response)
-#         update_task_status(task_id, "agent_responded")
-
-#         return {
-#             "success": True,
-#             "message": "Task processed successfully",
-#             "task_id": task_id,
-#             "status": "agent_responded",
-#             "agent_response": agent_response
-#         }
-
-#     except HTTPException:
-#         raise
-
-#     except Exception as e:
-#         error_msg = f"Error processing task: {str(e)}"
-#         try:
-#             update_task_status(task_id, "error")
-#             insert_agent_response(task_id, f"Error: {error_msg}")
-#         except:
-#             pass
-#         print(f"Error in process_task_message: {error_msg}")
-#         print(f"Traceback: {traceback.format_exc()}")
-
-#         raise HTTPException(status_code=500, detail=error_msg)
\ No newline at end of file
+            queue_depth = get_worker_pool().admit()
+        except Exception as e:
+            end_run(run)
+            run.fail(e)
+            raise
+        _launch(_execute_run(run, user_message, queue_depth, consistency=consistency))
+    return run
+
+async def cancel_task_run(task_id: str) -> Optional[Dict[str, Any]]:
+    """Cancel the run of a task in this process or on the job queue; None if nothing is running"""
+    run = cancel_run(task_id)
+    if run is not None:
+        return dict(run.describe(), status="cancelling")
+    if not job_queue_in_use():
+        return None
+    job = await run_io(get_job_queue().request_cancel, task_id)
+    if job is None:
+        return None
+    if job["status"] == "cancelled":
+        # Never reached a worker: release the task here
+        await run_io(record_task_cancelled, task_id)
+        return {"task_id": task_id, "job_id": job["id"], "status": "cancelled"}
+    return {"task_id": task_id, "job_id": job["id"], "status": "cancelling"}
+
+async def _sse_events(run: InFlightRun, greeting: Optional[Tuple[str, Dict[str, Any]]] = None) -> AsyncIterator[str]:
+    if greeting is not None:
+        yield _sse(*greeting)
+    async for event, data in run.events():
+        yield _sse(event, data)
+
+async def open_task_stream(task_id: str, agent_id: str, user_message: str,
+                           consistency: str = WRITE_CONSISTENCY) -> AsyncIterator[str]:
+    """Admit a task and return a Server-Sent Events stream of its tokens, steps and final response
+
+    A task already running here is followed instead: its events so far are replayed first.
+    """
+    run, created = start_run(task_id, agent_id, "stream")
+    if not created:
+        return _sse_events(run, ("attached", {"task_id": task_id, "mode": run.mode, "attached": run.attached}))
+    
+    # Admission errors are raised here, before the streaming response starts
+    queue_depth = await _admit_run(run)
+    record: Dict[str, Any] = {"stream_id": None, "chunks": []}
+    
+    def on_token(token: str) -> None:
+        # Stop forwarding tokens of a cancelled run; the next step ends it
+        check_cancelled()
+        # The streamed row is created on the first token so chat history read
+        # at the start of the run never contains an empty assistant message
+        try:
+            if record["stream_id"] is None:
+                record["stream_id"] = create_streaming_chat_record(task_id)
+            update_streaming_content(record["stream_id"], token)
+            record["chunks"].append(token)
+        except Exception as e:
+            logger.warning("Stream callback failed", extra={"fields": {"task_id": task_id, "error": str(e)}})
+        run.publish("token", {"token": token})
+    
+    run.publish("queued", {"task_id": task_id, "status": "agent_processing", "queue_depth": queue_depth})
+    sink = TaskStreamSink(on_token, run.publish)
+    _launch(_execute_run(run, user_message, queue_depth, sink, record, consistency=consistency))
+    return _sse_events(run)
+
+
+async def _admit_waiting() -> int:
+    """Reserve a worker slot, waiting while the pool is saturated: batch items are already claimed"""
+    delay = 0.05
+    while True:
+        try:
+            return get_worker_pool().admit()
+        except PoolSaturatedError:
+            await asyncio.sleep(delay)
+            delay = min(1.0, delay * 2)
+
+async def _claim_batch(runs: List[InFlightRun]) -> List[InFlightRun]:
+    """Claim the tasks of newly registered runs in one statement; the others fail with 404 or 400"""
+    if not runs:
+        return []
+    try:
+        with span("admission"):
+            claimed = set(await aclaim_tasks([run.task_id for run in runs]))
+        rejected = [run for run in runs if run.task_id not in claimed]
+        # Only the rejection path pays for telling "missing" and "busy" apart
+        existing = await afind_existing_tasks([run.task_id for run in rejected]) if rejected else set()
+    except Exception as e:
+        error = e if isinstance(e, HTTPException) else HTTPException(status_code=500, detail=str(e))
+        for run in runs:
+            end_run(run)
+            run.fail(error)
+        return []
+    for run in rejected:
+        end_run(run)
+        if run.task_id in existing:
+            run.fail(HTTPException(status_code=400, detail="Task is already being processed"))
+        else:
+            run.fail(HTTPException(status_code=404, detail="Task not found"))
+    return [run for run in runs if run.task_id in claimed]
+
+async def _warm_agent_templates(agent_ids: Set[str]) -> None:
+    # Fetch and compile each distinct agent's template once, before its items fan out, so a
+    # cold agent is not fetched by every one of its items at the same time; each item then
+    # builds its own Agent (tools and LLMs) from the cached template
+    results = await asyncio.gather(
+        *(asyncio.to_thread(get_agent_template, agent_id) for agent_id in agent_ids), return_exceptions=True
+    )
+    for agent_id, result in zip(agent_ids, results):
+        if isinstance(result, Exception):
+            # Its items report the error themselves
+            logger.warning("Could not build agent template", extra={"fields": {"agent_id": agent_id, "error": str(result)}})
+
+async def _run_batch(runs: List[Tuple[InFlightRun, str]], concurrency: int, consistency: str) -> None:
+    await _warm_agent_templates({run.agent_id for run, _ in runs})
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_item(run: InFlightRun, user_message: str) -> None:
+        async with semaphore:
+            queue_depth = await _admit_waiting()
+            await _execute_run(run, user_message, queue_depth, consistency=consistency)
+
+    await asyncio.gather(*(run_item(run, user_message) for run, user_message in runs))
+
+async def _batch_result(run: InFlightRun, deduplicated: bool = False) -> Dict[str, Any]:
+    try:
+        return dict(await run.wait(), agent_id=run.agent_id, deduplicated=deduplicated)
+    except HTTPException as e:
+        return {
+            "success": False,
+            "task_id": run.task_id,
+            "agent_id": run.agent_id,
+            "status_code": e.status_code,
+            "detail": e.detail,
+            "deduplicated": deduplicated
+        }
+
+async def _settled(result: Dict[str, Any]) -> Dict[str, Any]:
+    return result
+
+async def _ndjson_results(outcomes: List[Any]) -> AsyncIterator[str]:
+    for outcome in asyncio.as_completed(outcomes):
+        yield json.dumps(await outcome, default=str) + "\n"
+
+async def open_task_batch(items: List[Dict[str, str]], concurrency: int = BATCH_MAX_CONCURRENCY,
+                          consistency: str = WRITE_CONSISTENCY) -> AsyncIterator[str]:
+    """Admit a batch of tasks and return an NDJSON stream of per-item results in completion order
+
+    All tasks are claimed in one bulk statement, each agent's template is built once, and
+    at most `concurrency` items run at a time. A task already running here is awaited
+    instead of re-run. Claimed items run to completion even if the client disconnects.
+    """
+    outcomes: List[Any] = []
+    created_runs: List[Tuple[InFlightRun, str]] = []
+    seen: Set[str] = set()
+    for item in items:
+        task_id, agent_id = item["task_id"], item["agent_id"]
+        if task_id in seen:
+            outcomes.append(_settled({
+                "success": False,
+                "task_id": task_id,
+                "agent_id": agent_id,
+                "status_code": 400,
+                "detail": "Duplicate task_id in batch",
+                "deduplicated": False
+            }))
+            continue
+        seen.add(task_id)
+        run, created = start_run(task_id, agent_id, "batch")
+        if created:
+            created_runs.append((run, item["user_message"]))
+            outcomes.append(_batch_result(run))
+        else:
+            outcomes.append(_batch_result(run, deduplicated=True))
+
+    claimed = {run.task_id for run in await _claim_batch([run for run, _ in created_runs])}
+    runs = [(run, user_message) for run, user_message in created_runs if run.task_id in claimed]
+    if runs:
+        _launch(_run_batch(runs, max(1, min(concurrency, BATCH_MAX_CONCURRENCY)), consistency))
+    return _ndjson_results(outcomes)
@@ -0,0 +1,529 @@
+# repository.py
+
+from typing import Any, Dict, Iterable, List, Optional
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from worker_pool import run_io
+
+# "supabase" (default) or "sqlite" for offline load tests and profiling
+DATA_BACKEND = os.getenv("DATA_BACKEND", "supabase")
+SQLITE_PATH = os.getenv("SQLITE_PATH", ":memory:")
+
+
+class TaskRepository(ABC):
+    """Storage operations used by the data services; one implementation per backend"""
+
+    @abstractmethod
+    def get_agent(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def get_tools(self, tool_ids: List[str]) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def get_agent_config(self, config_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def get_task(self, task_id: str, columns: str = "id, task_status") -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def list_tasks(self, task_ids: List[str], columns: str = "id, task_status") -> List[Dict[str, Any]]:
+        """Rows of the given tasks that exist, in one query"""
+
+    @abstractmethod
+    def claim_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Set task_status to agent_processing unless it already is; returns the row or None"""
+
+    @abstractmethod
+    def claim_tasks(self, task_ids: List[str]) -> List[Dict[str, Any]]:
+        """claim_task for many tasks in a single statement; returns the rows that were claimed"""
+
+    @abstractmethod
+    def update_task_status(self, task_id: str, status: str) -> None:
+        ...
+
+    @abstractmethod
+    def update_tasks_status(self, task_ids: List[str], status: str) -> None:
+        """Set one status on many tasks in a single statement (one per chunk of ids on PostgREST)"""
+
+    @abstractmethod
+    def list_task_chats(self, task_id: str, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Rows (id, role, content, created_at) oldest first, optionally from created_at >= since"""
+
+    @abstractmethod
+    def insert_task_chat(self, task_id: str, role: str, content: str) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def insert_task_chats(self, rows: List[Dict[str, Any]]) -> None:
+        """Bulk insert of chat rows (id, task_id, role, content, created_at) in a single statement"""
+
+    @abstractmethod
+    def get_task_chat(self, chat_id: str, columns: str = "content, task_id") -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def update_task_chat_content(self, chat_id: str, content: str) -> None:
+        ...
+
+    # Async variants for the request handlers; by default the sync call runs on the I/O pool
+
+    async def aget_task(self, task_id: str, columns: str = "id, task_status") -> Optional[Dict[str, Any]]:
+        return await run_io(self.get_task, task_id, columns)
+
+    async def aclaim_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return await run_io(self.claim_task, task_id)
+
+    async def aclaim_tasks(self, task_ids: List[str]) -> List[Dict[str, Any]]:
+        return await run_io(self.claim_tasks, task_ids)
+
+    async def alist_tasks(self, task_ids: List[str], columns: str = "id, task_status") -> List[Dict[str, Any]]:
+        return await run_io(self.list_tasks, task_ids, columns)
+
+    async def aupdate_task_status(self, task_id: str, status: str) -> None:
+        await run_io(self.update_task_status, task_id, status)
+
+    async def ainsert_task_chat(self, task_id: str, role: str, content: str) -> Dict[str, Any]:
+        return await run_io(self.insert_task_chat, task_id, role, content)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# Ids per `in` filter, so bulk queries stay within URL length limits
+_IN_CHUNK_SIZE = 100
+
+
+def _chunks(ids: List[str]) -> Iterable[List[str]]:
+    for start in range(0, len(ids), _IN_CHUNK_SIZE):
+        yield ids[start:start + _IN_CHUNK_SIZE]
+
+
+class SupabaseRepository(TaskRepository):
+    """PostgREST queries against the Supabase project"""
+
+    def __init__(self, client: Any = None, async_client: Any = None):
+        self._client = client
+        self._async_client = async_client
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            from supabase_client import get_supabase
+            self._client = get_supabase()
+        return self._client
+
+    async def aclient(self) -> Any:
+        if self._async_client is not None:
+            return self._async_client
+        from supabase_client import get_async_supabase
+        return await get_async_supabase()
+
+    def get_agent(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        result = self.client.table("s_agent_basic_metadata").select("*").eq("id", agent_id).limit(1).execute()
+        return result.data[0] if result.data else None
+
+    def get_tools(self, tool_ids: List[str]) -> List[Dict[str, Any]]:
+        result = self.client.table("api_metadata").select("*").in_("id", tool_ids).execute()
+        return result.data or []
+
+    def get_agent_config(self, config_id: str) -> Optional[Dict[str, Any]]:
+        result = self.client.table("s_agent_configs").select("*").eq("id", config_id).limit(1).execute()
+        return result.data[0] if result.data else None
+
+    def get_task(self, task_id: str, columns: str = "id, task_status") -> Optional[Dict[str, Any]]:
+        result = self.client.table("s_tasks").select(columns).eq("id", task_id).limit(1).execute()
+        return result.data[0] if result.data else None
+
+    def list_tasks(self, task_ids: List[str], columns: str = "id, task_status") -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        for chunk in _chunks(task_ids):
+            rows.extend(self.client.table("s_tasks").select(columns).in_("id", chunk).execute().data or [])
+        return rows
+
+    def claim_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        result = (
+            self.client.table("s_tasks")
+            .update({"task_status": "agent_processing"})
+            .eq("id", task_id)
+            .or_("task_status.is.null,task_status.neq.agent_processing")
+            .execute()
+        )
+        return result.data[0] if result.data else None
+
+    def claim_tasks(self, task_ids: List[str]) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        for chunk in _chunks(task_ids):
+            result = (
+                self.client.table("s_tasks")
+                .update({"task_status": "agent_processing"})
+                .in_("id", chunk)
+                .or_("task_status.is.null,task_status.neq.agent_processing")
+                .execute()
+            )
+            rows.extend(result.data or [])
+        return rows
+
+    def update_task_status(self, task_id: str, status: str) -> None:
+        self.client.table("s_tasks").update({"task_status": status}).eq("id", task_id).execute()
+
+    def update_tasks_status(self, task_ids: List[str], status: str) -> None:
+        for chunk in _chunks(task_ids):
+            self.client.table("s_tasks").update({"task_status": status}).in_("id", chunk).execute()
+
+    def list_task_chats(self, task_id: str, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        query = (
+            self.client.table("s_taskchats")
+            .select("id, role, content, created_at")
+            .eq("task_id", task_id)
+        )
+        if since is not None:
+            query = query.gte("created_at", since)
+        return query.order("created_at", desc=False).execute().data or []
+
+    def insert_task_chat(self, task_id: str, role: str, content: str) -> Dict[str, Any]:
+        result = self.client.table("s_taskchats").insert({
+            "task_id": task_id,
+            "role": role,
+            "content": content
+        }).execute()
+        return result.data[0]
+
+    def insert_task_chats(self, rows: List[Dict[str, Any]]) -> None:
+        # Minimal returning: the rows are not read back
+        self.client.table("s_taskchats").insert(rows, returning="minimal").execute()
+
+    def get_task_chat(self, chat_id: str, columns: str = "content, task_id") -> Optional[Dict[str, Any]]:
+        result = self.client.table("s_taskchats").select(columns).eq("id", chat_id).limit(1).execute()
+        return result.data[0] if result.data else None
+
+    def update_task_chat_content(self, chat_id: str, content: str) -> None:
+        self.client.table("s_taskchats").update({
+            "content": content,
+            "updated_at": _now()
+        }).eq("id", chat_id).execute()
+
+    async def aget_task(self, task_id: str, columns: str = "id, task_status") -> Optional[Dict[str, Any]]:
+        client = await self.aclient()
+        result = await client.table("s_tasks").select(columns).eq("id", task_id).limit(1).execute()
+        return result.data[0] if result.data else None
+
+    async def aclaim_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        client = await self.aclient()
+        result = await (
+            client.table("s_tasks")
+            .update({"task_status": "agent_processing"})
+            .eq("id", task_id)
+            .or_("task_status.is.null,task_status.neq.agent_processing")
+            .execute()
+        )
+        return result.data[0] if result.data else None
+
+    async def aclaim_tasks(self, task_ids: List[str]) -> List[Dict[str, Any]]:
+        client = await self.aclient()
+        rows: List[Dict[str, Any]] = []
+        for chunk in _chunks(task_ids):
+            result = await (
+                client.table("s_tasks")
+                .update({"task_status": "agent_processing"})
+                .in_("id", chunk)
+                .or_("task_status.is.null,task_status.neq.agent_processing")
+                .execute()
+            )
+            rows.extend(result.data or [])
+        return rows
+
+    async def alist_tasks(self, task_ids: List[str], columns: str = "id, task_status") -> List[Dict[str, Any]]:
+        client = await self.aclient()
+        rows: List[Dict[str, Any]] = []
+        for chunk in _chunks(task_ids):
+            result = await client.table("s_tasks").select(columns).in_("id", chunk).execute()
+            rows.extend(result.data or [])
+        return rows
+
+    async def aupdate_task_status(self, task_id: str, status: str) -> None:
+        client = await self.aclient()
+        await client.table("s_tasks").update({"task_status": status}).eq("id", task_id).execute()
+
+    async def ainsert_task_chat(self, task_id: str, role: str, content: str) -> Dict[str, Any]:
+        client = await self.aclient()
+        result = await client.table("s_taskchats").insert({
+            "task_id": task_id,
+            "role": role,
+            "content": content
+        }).execute()
+        return result.data[0]
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS s_tasks (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT,
+    task_status TEXT
+);
+CREATE TABLE IF NOT EXISTS s_taskchats (
+    id TEXT PRIMARY KEY,
+    task_id TEXT NOT NULL REFERENCES s_tasks (id),
+    role TEXT NOT NULL,
+    content TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS s_taskchats_task_created ON s_taskchats (task_id, created_at);
+CREATE TABLE IF NOT EXISTS s_agent_basic_metadata (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT,
+    name TEXT,
+    role TEXT NOT NULL,
+    goal TEXT NOT NULL,
+    backstory TEXT NOT NULL,
+    tools TEXT,
+    config_id TEXT
+);
+CREATE TABLE IF NOT EXISTS api_metadata (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT,
+    name TEXT NOT NULL,
+    tool_description TEXT,
+    endpoint_url TEXT NOT NULL,
+    http_method TEXT NOT NULL,
+    headers TEXT,
+    query_params TEXT,
+    body TEXT,
+    connect_timeout REAL,
+    read_timeout REAL,
+    cache_ttl_seconds REAL
+);
+CREATE TABLE IF NOT EXISTS s_agent_configs (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT,
+    llm TEXT,
+    function_calling_llm TEXT,
+    max_iter INTEGER,
+    max_rpm INTEGER,
+    max_execution_time INTEGER,
+    verbose INTEGER,
+    allow_delegation INTEGER,
+    step_callback TEXT,
+    cache INTEGER,
+    system_template TEXT,
+    prompt_template TEXT,
+    response_template TEXT,
+    allow_code_execution INTEGER,
+    max_retry_limit INTEGER,
+    respect_context_window INTEGER,
+    code_execution_mode TEXT,
+    multimodal INTEGER,
+    inject_date INTEGER,
+    date_format TEXT,
+    reasoning INTEGER,
+    max_reasoning_attempts INTEGER,
+    embedder TEXT,
+    knowledge_sources TEXT,
+    user_system_prompt TEXT
+);
+"""
+
+# Columns stored as JSON text in SQLite (jsonb/arrays in Postgres)
+_JSON_COLUMNS = {
+    "s_agent_basic_metadata": ("tools",),
+    "s_agent_configs": ("embedder", "knowledge_sources"),
+}
+_BOOL_COLUMNS = {
+    "s_agent_configs": (
+        "verbose", "allow_delegation", "cache", "allow_code_execution", "respect_context_window",
+        "multimodal", "inject_date", "reasoning",
+    ),
+}
+
+
+class SQLiteRepository(TaskRepository):
+    """In-process backend with the same tables as Supabase, for offline benchmarks and profiling"""
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SQLITE_SCHEMA)
+
+    def _decode(self, table: str, row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        data = dict(row)
+        for column in _JSON_COLUMNS.get(table, ()):
+            if isinstance(data.get(column), str):
+                data[column] = json.loads(data[column])
+        for column in _BOOL_COLUMNS.get(table, ()):
+            if data.get(column) is not None:
+                data[column] = bool(data[column])
+        return data
+
+    def _query(self, table: str, sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(sql, tuple(params)).fetchall()
+        return [self._decode(table, row) for row in rows]
+
+    def _one(self, table: str, sql: str, params: Iterable[Any] = ()) -> Optional[Dict[str, Any]]:
+        rows = self._query(table, sql, params)
+        return rows[0] if rows else None
+
+    @staticmethod
+    def _columns(columns: str) -> str:
+        names = [name.strip() for name in columns.split(",")]
+        if not all(name == "*" or name.isidentifier() for name in names):
+            raise ValueError(f"Invalid column list: {columns}")
+        return ", ".join(names)
+
+    def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> None:
+        """Insert or replace fixture rows; JSON columns may be given as Python values"""
+        with self._lock:
+            for row in rows:
+                row = dict(row)
+                row.setdefault("created_at", _now())
+                for column in _JSON_COLUMNS.get(table, ()):
+                    if column in row and not isinstance(row[column], str) and row[column] is not None:
+                        row[column] = json.dumps(row[column])
+                for column in ("headers", "query_params", "body"):
+                    if table == "api_metadata" and isinstance(row.get(column), dict):
+                        row[column] = json.dumps(row[column])
+                names = ", ".join(row)
+                marks = ", ".join("?" for _ in row)
+                self._conn.execute(f"INSERT OR REPLACE INTO {table} ({names}) VALUES ({marks})", tuple(row.values()))
+
+    def get_agent(self, agent_id: str) -> Optional[Dict[str, Any]]:
+        return self._one("s_agent_basic_metadata", "SELECT * FROM s_agent_basic_metadata WHERE id = ?", (agent_id,))
+
+    def get_tools(self, tool_ids: List[str]) -> List[Dict[str, Any]]:
+        marks = ", ".join("?" for _ in tool_ids)
+        return self._query("api_metadata", f"SELECT * FROM api_metadata WHERE id IN ({marks})", tool_ids)
+
+    def get_agent_config(self, config_id: str) -> Optional[Dict[str, Any]]:
+        return self._one("s_agent_configs", "SELECT * FROM s_agent_configs WHERE id = ?", (config_id,))
+
+    def get_task(self, task_id: str, columns: str = "id, task_status") -> Optional[Dict[str, Any]]:
+        return self._one("s_tasks", f"SELECT {self._columns(columns)} FROM s_tasks WHERE id = ?", (task_id,))
+
+    def claim_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE s_tasks SET task_status = 'agent_processing', updated_at = ? "
+                "WHERE id = ? AND (task_status IS NULL OR task_status != 'agent_processing')",
+                (_now(), task_id),
+            )
+            if cursor.rowcount == 0:
+                return None
+            row = self._conn.execute("SELECT * FROM s_tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._decode("s_tasks", row)
+
+    def list_tasks(self, task_ids: List[str], columns: str = "id, task_status") -> List[Dict[str, Any]]:
+        marks = ", ".join("?" for _ in task_ids)
+        return self._query("s_tasks", f"SELECT {self._columns(columns)} FROM s_tasks WHERE id IN ({marks})", task_ids)
+
+    def claim_tasks(self, task_ids: List[str]) -> List[Dict[str, Any]]:
+        marks = ", ".join("?" for _ in task_ids)
+        with self._lock:
+            # IMMEDIATE: no other process can claim between the select and the update
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    f"SELECT * FROM s_tasks WHERE id IN ({marks}) "
+                    "AND (task_status IS NULL OR task_status != 'agent_processing')",
+                    tuple(task_ids),
+                ).fetchall()
+                claimed = [row["id"] for row in rows]
+                if claimed:
+                    self._conn.execute(
+                        f"UPDATE s_tasks SET task_status = 'agent_processing', updated_at = ? "
+                        f"WHERE id IN ({', '.join('?' for _ in claimed)})",
+                        (_now(), *claimed),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [dict(self._decode("s_tasks", row), task_status="agent_processing") for row in rows]
+
+    def update_task_status(self, task_id: str, status: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE s_tasks SET task_status = ?, updated_at = ? WHERE id = ?", (status, _now(), task_id))
+
+    def update_tasks_status(self, task_ids: List[str], status: str) -> None:
+        marks = ", ".join("?" for _ in task_ids)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE s_tasks SET task_status = ?, updated_at = ? WHERE id IN ({marks})", (status, _now(), *task_ids)
+            )
+
+    def list_task_chats(self, task_id: str, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        sql = "SELECT id, role, content, created_at FROM s_taskchats WHERE task_id = ?"
+        params: List[Any] = [task_id]
+        if since is not None:
+            sql += " AND created_at >= ?"
+            params.append(since)
+        return self._query("s_taskchats", sql + " ORDER BY created_at ASC", params)
+
+    def insert_task_chat(self, task_id: str, role: str, content: str) -> Dict[str, Any]:
+        row = {"id": str(uuid.uuid4()), "task_id": task_id, "role": role, "content": content, "created_at": _now()}
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO s_taskchats (id, task_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                tuple(row.values()),
+            )
+        return row
+
+    def insert_task_chats(self, rows: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO s_taskchats (id, task_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(row.get("id") or str(uuid.uuid4()), row["task_id"], row["role"], row["content"], row.get("created_at") or _now()) for row in rows],
+            )
+
+    def get_task_chat(self, chat_id: str, columns: str = "content, task_id") -> Optional[Dict[str, Any]]:
+        return self._one("s_taskchats", f"SELECT {self._columns(columns)} FROM s_taskchats WHERE id = ?", (chat_id,))
+
+    def update_task_chat_content(self, chat_id: str, content: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE s_taskchats SET content = ?, updated_at = ? WHERE id = ?", (content, _now(), chat_id))
+
+
+_repository: Optional[TaskRepository] = None
+_repository_lock = threading.Lock()
+
+
+def get_repository() -> TaskRepository:
+    """Process-wide repository selected by DATA_BACKEND"""
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                if DATA_BACKEND == "sqlite":
+                    _repository = SQLiteRepository(SQLITE_PATH)
+                elif DATA_BACKEND == "supabase":
+                    _repository = SupabaseRepository()
+                else:
+                    raise ValueError(f"Unknown DATA_BACKEND: {DATA_BACKEND}")
+    return _repository
+
+
+def set_repository(repository: TaskRepository) -> None:
+    """Swap the backend, e.g. a seeded SQLiteRepository in benchmarks"""
+    global _repository
+    with _repository_lock:
+        _repository = repository
@@ -0,0 +1,79 @@
+# stream_events.py
+
+from typing import Any, Callable, Dict, Optional
+from contextlib import contextmanager
+import threading
+
+_local = threading.local()
+_register_lock = threading.Lock()
+_handlers_registered = False
+
+
+class TaskStreamSink:
+    """Receives the LLM tokens and agent step events of one agent run"""
+
+    def __init__(self, on_token: Callable[[str], None], on_event: Callable[[str, Dict[str, Any]], None]):
+        self.on_token = on_token
+        self.on_event = on_event
+
+    def step(self, step_output: Any) -> None:
+        """Agent step_callback: forwards each reasoning/tool step as an event"""
+        self.on_event("step", describe_step(step_output))
+
+
+def describe_step(step_output: Any) -> Dict[str, Any]:
+    """JSON-safe summary of a CrewAI AgentAction/AgentFinish/ToolResult"""
+    step: Dict[str, Any] = {"type": type(step_output).__name__}
+    for field in ("thought", "tool", "tool_input", "result", "output", "text"):
+        value = getattr(step_output, field, None)
+        if value is not None:
+            step[field] = value if isinstance(value, (str, int, float, bool)) else str(value)
+    return step
+
+
+def current_sink() -> Optional[TaskStreamSink]:
+    return getattr(_local, "sink", None)
+
+
+@contextmanager
+def streaming_to(sink: TaskStreamSink):
+    """Route CrewAI stream events emitted by this thread to sink"""
+    register_stream_handlers()
+    _local.sink = sink
+    try:
+        yield sink
+    finally:
+        _local.sink = None
+
+
+def register_stream_handlers() -> None:
+    """Subscribe to the CrewAI event bus once per process"""
+    global _handlers_registered
+    with _register_lock:
+        if _handlers_registered:
+            return
+        from crewai.utilities.events import crewai_event_bus
+        from crewai.utilities.events.llm_events import LLMStreamChunkEvent
+        from crewai.utilities.events.tool_usage_events import ToolUsageStartedEvent, ToolUsageFinishedEvent
+
+        # The bus calls handlers synchronously in the emitting thread, so the
+        # thread-local sink identifies which run a chunk belongs to
+        @crewai_event_bus.on(LLMStreamChunkEvent)
+        def _on_stream_chunk(source: Any, event: Any) -> None:
+            sink = current_sink()
+            if sink is not None and event.chunk:
+                sink.on_token(event.chunk)
+
+        @crewai_event_bus.on(ToolUsageStartedEvent)
+        def _on_tool_started(source: Any, event: Any) -> None:
+            sink = current_sink()
+            if sink is not None:
+                sink.on_event("tool_started", {"tool": event.tool_name})
+
+        @crewai_event_bus.on(ToolUsageFinishedEvent)
+        def _on_tool_finished(source: Any, event: Any) -> None:
+            sink = current_sink()
+            if sink is not None:
+                sink.on_event("tool_finished", {"tool": event.tool_name, "from_cache": event.from_cache})
+
+        _handlers_registered = True
@@ -1,13 +1,69 @@
-from supabase import create_client
+import asyncio
 import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from supabase import AsyncClient, Client
+
 load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
+_client: Optional["Client"] = None
+_client_lock = threading.Lock()
+
+
+def get_supabase() -> "Client":
+    """Create the Supabase client on first use so importing this module does no I/O"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not SUPABASE_URL or not SUPABASE_KEY:
+                    raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
+                from supabase import create_client
+                _client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _client
+
+
+# httpx async clients are bound to the loop that created them, so keep one per loop
+_async_clients: Dict[asyncio.AbstractEventLoop, "AsyncClient"] = {}
+
+
+async def get_async_supabase() -> "AsyncClient":
+    """Async client of the running event loop; its HTTP/2 connections are reused across requests"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
+        from supabase import acreate_client
+        created = await acreate_client(SUPABASE_URL, SUPABASE_KEY)
+        # Another coroutine may have created one while this one awaited
+        client = _async_clients.setdefault(loop, created)
+    return client
+
+
+async def aclose_async_supabase() -> None:
+    """Close the async client of the running loop (called from the FastAPI lifespan)"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.postgrest.aclose()
+
+
+def init_supabase() -> None:
+    """Create the client up front (called from the FastAPI lifespan)"""
+    get_supabase()
+
+
+class _LazySupabase:
+    """Stands in for the client in `from supabase_client import supabase` until it is first used"""
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_supabase(), name)
+
 
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
\ No newline at end of file
+supabase = _LazySupabase()
@@ -0,0 +1,49 @@
+# task_jobs.py
+
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+import os
+import threading
+import time
+
+TASK_JOB_RETENTION = int(os.getenv("TASK_JOB_RETENTION", "1000"))
+
+_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def create_job(task_id: str, agent_id: str, queue_depth: int = 0) -> Dict[str, Any]:
+    """Register a background run for a task, replacing any finished earlier run"""
+    job = {
+        "task_id": task_id,
+        "agent_id": agent_id,
+        "status": "queued",
+        "queue_depth": queue_depth,
+        "submitted_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "agent_response": None,
+        "error": None,
+        "timing": None,
+    }
+    with _lock:
+        _jobs.pop(task_id, None)
+        _jobs[task_id] = job
+        while len(_jobs) > TASK_JOB_RETENTION:
+            _jobs.popitem(last=False)
+    return dict(job)
+
+
+def update_job(task_id: str, **fields: Any) -> None:
+    """Merge fields into a job record; a no-op for unknown tasks"""
+    with _lock:
+        job = _jobs.get(task_id)
+        if job is not None:
+            job.update(fields)
+
+
+def get_job(task_id: str) -> Optional[Dict[str, Any]]:
+    """Snapshot of the latest run recorded for a task"""
+    with _lock:
+        job = _jobs.get(task_id)
+        return dict(job) if job is not None else None
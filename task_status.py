@@ -0,0 +1,129 @@
+# task_status.py
+
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import os
+import threading
+import time
+from metrics import register_gauges
+
+# Statuses written by this process are current immediately; ones written elsewhere
+# (a worker process, another replica) are picked up once the cached entry is this old
+TASK_STATUS_CACHE_TTL_SECONDS = float(os.getenv("TASK_STATUS_CACHE_TTL_SECONDS", "2"))
+TASK_STATUS_CACHE_MAX_SIZE = int(os.getenv("TASK_STATUS_CACHE_MAX_SIZE", "10000"))
+
+Watcher = Tuple[asyncio.AbstractEventLoop, asyncio.Event]
+
+
+class TaskStatusCache:
+    """Last known status of each task, written through by status updates; wakes watchers on transitions
+
+    set() may be called from any thread; watchers wait on their own event loop.
+    """
+
+    def __init__(self, ttl_seconds: float, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._watchers: Dict[str, List[Watcher]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.transitions = 0
+        self.evictions = 0
+
+    def get(self, task_id: str) -> Optional[str]:
+        """Cached status if it was written or read within the TTL, else None"""
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is None or time.monotonic() - entry["validated_at"] >= self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(task_id)
+            self.hits += 1
+            return entry["status"]
+
+    def _store(self, task_id: str, status: str) -> List[Watcher]:
+        entry = self._entries.get(task_id)
+        changed = entry is not None and entry["status"] != status
+        self._entries[task_id] = {"status": status, "validated_at": time.monotonic()}
+        self._entries.move_to_end(task_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        if not changed and entry is not None:
+            return []
+        if changed:
+            self.transitions += 1
+        return self._watchers.pop(task_id, [])
+
+    @staticmethod
+    def _wake(watchers: List[Watcher]) -> None:
+        for loop, event in watchers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # Its loop is closed; nobody is waiting any more
+
+    def set(self, task_id: str, status: str) -> None:
+        """Record a status this process wrote"""
+        with self._lock:
+            self.writes += 1
+            watchers = self._store(task_id, status)
+        self._wake(watchers)
+
+    def fill(self, task_id: str, status: str, read_started: float) -> None:
+        """Record a status read from storage, unless a write landed after the read began"""
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is not None and entry["validated_at"] > read_started:
+                return
+            watchers = self._store(task_id, status)
+        self._wake(watchers)
+
+    def forget(self, task_id: str) -> None:
+        with self._lock:
+            self._entries.pop(task_id, None)
+
+    async def wait_for_change(self, task_id: str, seen: str, timeout: float) -> bool:
+        """Wait until the task's status differs from `seen`; False on timeout"""
+        event = asyncio.Event()
+        watcher = (asyncio.get_running_loop(), event)
+        with self._lock:
+            # Checked under the lock that set() takes, so no transition slips in before registering
+            entry = self._entries.get(task_id)
+            if entry is not None and entry["status"] != seen:
+                return True
+            self._watchers.setdefault(task_id, []).append(watcher)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                watchers = self._watchers.get(task_id)
+                if watchers is not None and watcher in watchers:
+                    watchers.remove(watcher)
+                    if not watchers:
+                        del self._watchers[task_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "transitions": self.transitions,
+                "evictions": self.evictions,
+                "watchers": sum(len(watchers) for watchers in self._watchers.values()),
+            }
+
+
+task_status_cache = TaskStatusCache(TASK_STATUS_CACHE_TTL_SECONDS, TASK_STATUS_CACHE_MAX_SIZE)
+register_gauges("task_status_cache", "Task status cache counter", task_status_cache.stats)
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from inflight import TaskCancelledError, cancel_run, cancellable, check_cancelled, end_run, start_run
+from worker_pool import AgentWorkerPool, PoolSaturatedError
+
+
+def test_pool_rejects_admissions_beyond_workers_and_queue():
+    pool = AgentWorkerPool(max_workers=1, max_queue=1)
+    try:
+        assert pool.admit() == 0
+        assert pool.admit() == 1
+        with pytest.raises(PoolSaturatedError):
+            pool.admit()
+        pool.release()
+        assert pool.admit() == 1
+        assert pool.stats()["rejected"] == 1
+    finally:
+        pool.shutdown()
+
+
+def test_admitted_runs_wait_for_a_free_worker():
+    pool = AgentWorkerPool(max_workers=1, max_queue=4)
+
+    async def run_three():
+        return await asyncio.gather(*(pool.run(lambda value=value: value) for value in range(3)))
+
+    try:
+        results = asyncio.run(run_three())
+        assert [result for result, _ in results] == [0, 1, 2]
+        assert pool.stats() == dict(pool.stats(), running=0, queued=0, completed=3)
+    finally:
+        pool.shutdown()
+
+
+def test_resubmitted_task_attaches_to_the_running_one():
+    async def submit_twice():
+        first, created = start_run("task-attach", "agent", "sync")
+        second, created_again = start_run("task-attach", "agent", "sync")
+        end_run(first)
+        return first is second, created, created_again
+
+    assert asyncio.run(submit_twice()) == (True, True, False)
+
+
+def test_cancelled_run_stops_at_its_next_check():
+    async def cancel_in_worker():
+        run, _ = start_run("task-cancel", "agent", "sync")
+        try:
+            def step():
+                with cancellable(run):
+                    check_cancelled()
+                    cancel_run("task-cancel")
+                    check_cancelled()
+
+            await asyncio.to_thread(step)
+        finally:
+            end_run(run)
+
+    with pytest.raises(TaskCancelledError):
+        asyncio.run(cancel_in_worker())
+    # Outside of a run there is nothing to cancel
+    check_cancelled()
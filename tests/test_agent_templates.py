@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("dotenv")
+
+import agent_builder
+from repository import SQLiteRepository, set_repository
+
+AGENT_ID = "template-agent"
+TOOL_ID = "template-tool"
+
+
+def _tool_row(url: str) -> dict:
+    return {"id": TOOL_ID, "name": "lookup", "endpoint_url": url, "http_method": "GET"}
+
+
+@pytest.fixture
+def repo(monkeypatch):
+    repo = SQLiteRepository()
+    repo.insert_rows("api_metadata", [_tool_row("https://api.example.com/v1")])
+    repo.insert_rows("s_agent_basic_metadata", [{
+        "id": AGENT_ID, "role": "Tester", "goal": "Test", "backstory": "None", "tools": [TOOL_ID], "config_id": "template-config"
+    }])
+    repo.insert_rows("s_agent_configs", [{"id": "template-config", "max_iter": 3}])
+    set_repository(repo)
+    # Every call revalidates, as once AGENT_CACHE_TTL_SECONDS has passed
+    monkeypatch.setattr(agent_builder.agent_template_cache, "ttl_seconds", 0)
+    agent_builder.invalidate_agent_template()
+    yield repo
+    agent_builder.invalidate_agent_template()
+
+
+def test_unchanged_rows_reuse_the_template(repo):
+    first = agent_builder.get_agent_template(AGENT_ID)
+    assert agent_builder.get_agent_template(AGENT_ID) is first
+
+
+def test_edited_tool_row_reaches_the_next_build(repo):
+    template = agent_builder.get_agent_template(AGENT_ID)
+    assert [spec.endpoint_url for spec in template["tool_specs"]] == ["https://api.example.com/v1"]
+
+    repo.insert_rows("api_metadata", [_tool_row("https://api.example.com/v2")])
+
+    template = agent_builder.get_agent_template(AGENT_ID)
+    assert [spec.endpoint_url for spec in template["tool_specs"]] == ["https://api.example.com/v2"]
@@ -0,0 +1,86 @@
+import pytest
+
+pytest.importorskip("fastapi")
+
+import data_service_other
+from repository import SQLiteRepository, set_repository
+
+
+class CountingRepository(SQLiteRepository):
+    """SQLite backend recording each chat history read as (since, rows returned)"""
+
+    def __init__(self):
+        super().__init__()
+        self.chat_reads = []
+
+    def list_task_chats(self, task_id, since=None):
+        rows = super().list_task_chats(task_id, since)
+        self.chat_reads.append((since, len(rows)))
+        return rows
+
+
+@pytest.fixture
+def repo():
+    repo = CountingRepository()
+    set_repository(repo)
+    data_service_other._history_cache.clear()
+    yield repo
+    data_service_other.flush_task_writes()
+    data_service_other._history_cache.clear()
+
+
+def test_history_is_fetched_incrementally_under_write_behind(repo):
+    # The default config buffers chat inserts
+    assert data_service_other._write_buffer is not None
+    task_id = "task-incremental"
+    for turn in range(5):
+        history = data_service_other.fetch_task_chat_history(task_id)
+        assert [message["content"] for message in history] == [f"answer {i}" for i in range(turn)]
+        data_service_other.insert_agent_response(task_id, f"answer {turn}")
+
+    # One full read on the first turn; after that only the row at the watermark is read back
+    assert repo.chat_reads[0] == (None, 0)
+    assert len(repo.chat_reads) == 5
+    assert all(since is not None and count == 1 for since, count in repo.chat_reads[1:])
+
+
+def test_flushed_row_older_than_the_watermark_drops_the_tail(repo):
+    task_id = "task-out-of-order"
+    repo.insert_task_chat(task_id, "assistant", "newer")
+    data_service_other.fetch_task_chat_history(task_id)
+    data_service_other._append_written_chats([{
+        "id": "older-row", "task_id": task_id, "role": "assistant", "content": "older",
+        "created_at": "2000-01-01T00:00:00+00:00"
+    }])
+    assert task_id not in data_service_other._history_cache
+
+
+def test_orphaned_empty_row_does_not_stop_the_history(repo):
+    task_id = "task-orphaned-stream"
+    repo.insert_task_chat(task_id, "assistant", "")
+    repo.insert_task_chat(task_id, "user", "still there?")
+    history = data_service_other.fetch_task_chat_history(task_id)
+    assert [message["content"] for message in history] == ["still there?"]
+
+
+def test_response_being_streamed_is_held_back(repo):
+    task_id = "task-streaming"
+    repo.insert_task_chat(task_id, "user", "question")
+    stream_id = data_service_other.create_streaming_chat_record(task_id)
+    assert [message["content"] for message in data_service_other.fetch_task_chat_history(task_id)] == ["question"]
+    data_service_other.complete_streaming_response(stream_id, "answer")
+    history = data_service_other.fetch_task_chat_history(task_id)
+    assert [message["content"] for message in history] == ["question", "answer"]
+
+
+def test_summary_is_re_read_when_the_tail_advances(repo, monkeypatch):
+    task_id = "task-summary"
+    summaries = iter(["first summary", "second summary"])
+    monkeypatch.setattr(data_service_other, "HISTORY_TOKEN_BUDGET", 20)
+    monkeypatch.setattr(data_service_other, "_fetch_task_summary", lambda task_id: next(summaries))
+    for turn in range(3):
+        repo.insert_task_chat(task_id, "assistant", f"a long answer number {turn} " * 4)
+    assert data_service_other.fetch_task_chat_history(task_id)[0]["content"].endswith("first summary")
+    assert data_service_other.fetch_task_chat_history(task_id)[0]["content"].endswith("first summary")
+    repo.insert_task_chat(task_id, "assistant", "one more answer " * 4)
+    assert data_service_other.fetch_task_chat_history(task_id)[0]["content"].endswith("second summary")
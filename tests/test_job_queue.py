@@ -0,0 +1,56 @@
+import time
+
+import job_queue
+from job_queue import SqliteJobQueue
+
+
+def _queue(tmp_path) -> SqliteJobQueue:
+    return SqliteJobQueue(str(tmp_path / "jobs.db"))
+
+
+def test_a_job_is_leased_to_one_worker_at_a_time(tmp_path):
+    queue = _queue(tmp_path)
+    job = queue.enqueue("task-1", "agent-1", "hello")
+    assert queue.claim("worker-1")["id"] == job["id"]
+    assert queue.claim("worker-2") is None
+
+
+def test_expired_lease_redelivers_the_job(tmp_path):
+    queue = _queue(tmp_path)
+    job = queue.enqueue("task-1", "agent-1", "hello")
+    queue.claim("worker-1", lease_seconds=0)
+    time.sleep(0.01)
+
+    redelivered = queue.claim("worker-2")
+    assert redelivered["id"] == job["id"]
+    assert redelivered["worker_id"] == "worker-2"
+    assert redelivered["attempts"] == 2
+
+
+def test_job_out_of_attempts_is_reaped_as_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 1)
+    queue = _queue(tmp_path)
+    queue.enqueue("task-1", "agent-1", "hello")
+    queue.claim("worker-1", lease_seconds=0)
+    time.sleep(0.01)
+
+    assert queue.claim("worker-2") is None
+    assert [job["task_id"] for job in queue.reap_expired()] == ["task-1"]
+    assert queue.latest_job("task-1")["status"] == "failed"
+
+
+def test_cancelling_a_running_job_reaches_its_worker(tmp_path):
+    queue = _queue(tmp_path)
+    queue.enqueue("task-1", "agent-1", "hello")
+    job = queue.claim("worker-1")
+    assert queue.heartbeat(job["id"]) is False
+    queue.request_cancel("task-1")
+    assert queue.heartbeat(job["id"]) is True
+
+
+def test_cancelling_a_queued_job_removes_it_from_the_queue(tmp_path):
+    queue = _queue(tmp_path)
+    queue.enqueue("task-1", "agent-1", "hello")
+    assert queue.request_cancel("task-1")["status"] == "cancelled"
+    assert queue.claim("worker-1") is None
+    assert queue.stats()["cancelled"] == 1
@@ -0,0 +1,53 @@
+import pytest
+
+import llm_cache
+
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def call(self, messages, tools=None, *args, **kwargs):
+        self.calls += 1
+        return f"answer {self.calls}"
+
+
+@pytest.fixture
+def exact_cache(monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MODE", "exact")
+    llm_cache.clear_llm_cache()
+    yield
+    llm_cache.clear_llm_cache()
+
+
+def test_repeated_prompt_is_answered_from_the_cache(exact_cache):
+    llm = llm_cache.cache_llm(CountingLLM(), "model")
+    messages = [{"role": "user", "content": "hi"}]
+    assert llm.call(messages) == "answer 1"
+    assert llm.call(messages) == "answer 1"
+    assert llm.call([{"role": "user", "content": "something else"}]) == "answer 2"
+    assert llm.calls == 2
+
+
+def test_model_and_tools_are_part_of_the_key(exact_cache):
+    llm = llm_cache.cache_llm(CountingLLM(), "model")
+    messages = [{"role": "user", "content": "hi"}]
+    llm.call(messages)
+    llm.call(messages, [{"name": "lookup"}])
+    llm_cache.cache_llm(CountingLLM(), "other-model").call(messages)
+    assert llm.calls == 2
+
+
+def test_native_function_calls_are_never_cached(exact_cache):
+    llm = llm_cache.cache_llm(CountingLLM(), "model")
+    messages = [{"role": "user", "content": "hi"}]
+    llm.call(messages, None, available_functions={"lookup": print})
+    llm.call(messages, None, available_functions={"lookup": print})
+    assert llm.calls == 2
+
+
+def test_cache_off_leaves_the_llm_untouched(monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_MODE", "off")
+    llm = CountingLLM()
+    call = llm.call
+    assert llm_cache.cache_llm(llm, "model").call == call
@@ -0,0 +1,44 @@
+from llm_limiter import LLMRateLimiter, MemoryBucketStore
+
+
+def test_rpm_bucket_throttles_once_a_minute_of_calls_is_spent():
+    store = MemoryBucketStore()
+    costs = {"rpm": (1, 2.0)}
+    assert store.take("model", costs) == 0
+    assert store.take("model", costs) == 0
+    # The next request is due after 60 / rpm seconds
+    assert 29 < store.take("model", costs) <= 30
+
+
+def test_tpm_refund_makes_room_for_the_next_call():
+    store = MemoryBucketStore()
+    assert store.take("model", {"tpm": (1000, 1000.0)}) == 0
+    assert store.take("model", {"tpm": (500, 1000.0)}) > 0
+    store.charge("model", "tpm", -600, 1000.0)
+    assert store.take("model", {"tpm": (500, 1000.0)}) == 0
+
+
+def test_paused_model_waits_out_the_backoff():
+    store = MemoryBucketStore()
+    store.pause("model", 5)
+    assert 4 < store.take("model", {"rpm": (1, 100.0)}) <= 5
+
+
+def test_model_without_limits_is_not_throttled():
+    limiter = LLMRateLimiter({}, MemoryBucketStore())
+    assert limiter.acquire("model", 100) == 0.0
+
+
+def test_config_rpm_merges_with_wildcard_and_explicit_limits_win():
+    limiter = LLMRateLimiter({"*": {"rpm": 500, "concurrency": 4}, "listed": {"rpm": 10}}, MemoryBucketStore())
+    limiter.set_default_rpm("model", 60, "config-a")
+    limiter.set_default_rpm("model", 30, "config-b")
+    assert limiter.limits_for("model") == {"rpm": 30.0, "concurrency": 4}
+
+    limiter.set_default_rpm("model", 90, "config-b")
+    assert limiter.limits_for("model")["rpm"] == 60.0
+
+    limiter.set_default_rpm("listed", 1, "config-a")
+    assert limiter.limits_for("listed") == {"rpm": 10}
+    # config-a moved to another model
+    assert limiter.limits_for("model")["rpm"] == 90.0
@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+from repository import SQLiteRepository
+
+
+def _repo_with_tasks(path: str = ":memory:", *task_ids: str) -> SQLiteRepository:
+    repo = SQLiteRepository(path)
+    repo.insert_rows("s_tasks", [{"id": task_id, "task_status": "idle"} for task_id in task_ids])
+    return repo
+
+
+def test_concurrent_claims_of_one_task_let_exactly_one_through():
+    repo = _repo_with_tasks(":memory:", "task-1")
+
+    async def claim_twice():
+        return await asyncio.gather(repo.aclaim_task("task-1"), repo.aclaim_task("task-1"))
+
+    results = asyncio.run(claim_twice())
+    assert sum(result is not None for result in results) == 1
+    assert repo.get_task("task-1")["task_status"] == "agent_processing"
+
+
+def test_claim_of_missing_task_returns_none():
+    repo = _repo_with_tasks(":memory:")
+    assert repo.claim_task("missing") is None
+
+
+def test_bulk_claims_from_two_processes_never_overlap(tmp_path):
+    path = str(tmp_path / "tasks.db")
+    task_ids = [f"task-{i}" for i in range(50)]
+    _repo_with_tasks(path, *task_ids)
+    # One connection each, as two processes sharing the file would have
+    repos = [SQLiteRepository(path), SQLiteRepository(path)]
+    claimed = [[], []]
+
+    def claim(index: int) -> None:
+        claimed[index] = [row["id"] for row in repos[index].claim_tasks(task_ids)]
+
+    threads = [threading.Thread(target=claim, args=(index,)) for index in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not set(claimed[0]) & set(claimed[1])
+    assert sorted(claimed[0] + claimed[1]) == sorted(task_ids)
@@ -0,0 +1,59 @@
+import pytest
+
+import tool_cache
+
+
+class FakeResponse:
+    def __init__(self, text: str, headers: dict):
+        self.text = text
+        self.headers = headers
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    tool_cache.clear_tool_cache()
+    yield
+    tool_cache.clear_tool_cache()
+
+
+def test_key_covers_method_headers_and_body():
+    key = tool_cache.cache_key("GET", "https://api.example.com", {"q": 1}, {"Authorization": "a"}, {"x": 1})
+    assert key == tool_cache.cache_key("get", "https://api.example.com", {"q": 1}, {"Authorization": "a"}, {"x": 1})
+    assert key != tool_cache.cache_key("HEAD", "https://api.example.com", {"q": 1}, {"Authorization": "a"}, {"x": 1})
+    assert key != tool_cache.cache_key("GET", "https://api.example.com", {"q": 1}, {"Authorization": "b"}, {"x": 1})
+    assert key != tool_cache.cache_key("GET", "https://api.example.com", {"q": 1}, {"Authorization": "a"}, {"x": 2})
+
+
+def test_only_safe_methods_with_a_ttl_are_cacheable():
+    assert tool_cache.is_cacheable("get", 60)
+    assert not tool_cache.is_cacheable("GET", None)
+    assert not tool_cache.is_cacheable("POST", 60)
+
+
+@pytest.mark.parametrize("cache_control, ttl", [
+    ("", 60.0),
+    ("max-age=10", 10.0),
+    ("public, s-maxage=5, max-age=10", 5.0),
+    ("max-age=600", 60.0),
+    ("no-cache", 0.0),
+    ("no-store", None),
+])
+def test_cache_control_bounds_the_configured_ttl(cache_control, ttl):
+    assert tool_cache._response_ttl({"Cache-Control": cache_control}, 60) == ttl
+
+
+def test_no_store_response_is_not_stored():
+    key = tool_cache.cache_key("GET", "https://api.example.com", {}, {})
+    tool_cache.store(key, FakeResponse("secret", {"Cache-Control": "no-store"}), 60)
+    assert tool_cache.lookup(key) == (None, False)
+
+
+def test_stale_entry_is_revalidated_with_its_validators():
+    key = tool_cache.cache_key("GET", "https://api.example.com", {}, {})
+    tool_cache.store(key, FakeResponse("body", {"Cache-Control": "no-cache", "ETag": '"v1"'}), 60)
+    entry, fresh = tool_cache.lookup(key)
+    assert entry["text"] == "body" and not fresh
+    assert tool_cache.conditional_headers(entry) == {"If-None-Match": '"v1"'}
+
+    tool_cache.refresh(key, entry, FakeResponse("", {}), 60)
+    assert tool_cache.lookup(key)[1] is True
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from repository import SQLiteRepository, set_repository
+from write_behind import WriteBehindBuffer, WriteFailedError
+
+
+class FlakyRepository(SQLiteRepository):
+    """Bulk inserts always fail; single-row inserts fail only for the tasks in failing_tasks"""
+
+    def __init__(self, failing_tasks=()):
+        super().__init__()
+        self.failing_tasks = set(failing_tasks)
+        self.bulk_attempts = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def insert_task_chats(self, rows):
+        self.release.wait()
+        if len(rows) > 1:
+            self.bulk_attempts += 1
+            raise RuntimeError("bulk insert failed")
+        if rows[0]["task_id"] in self.failing_tasks:
+            raise RuntimeError("row rejected")
+        super().insert_task_chats(rows)
+
+
+@pytest.fixture
+def buffer():
+    # Writes only on flush(), so every write of a test lands in one batch
+    buffer = WriteBehindBuffer(interval=60, max_batch=100)
+    yield buffer
+    buffer.close()
+
+
+def test_failing_rows_are_isolated_to_their_task(buffer):
+    repo = FlakyRepository(failing_tasks={"bad"})
+    set_repository(repo)
+    buffer.insert_chat("good", "assistant", "kept")
+    buffer.insert_chat("bad", "assistant", "dropped")
+
+    # The bulk insert was retried before the rows were written one by one
+    with pytest.raises(WriteFailedError):
+        buffer.flush("bad")
+    buffer.flush("good")
+    assert repo.bulk_attempts >= 1
+    assert [row["content"] for row in repo.list_task_chats("good")] == ["kept"]
+    assert repo.list_task_chats("bad") == []
+
+
+def test_flush_gives_up_after_its_timeout_and_the_write_still_lands(buffer):
+    repo = FlakyRepository()
+    repo.release.clear()
+    set_repository(repo)
+    buffer.insert_chat("slow", "assistant", "eventually")
+
+    with pytest.raises(WriteFailedError):
+        buffer.flush("slow", timeout=0.05)
+    assert buffer.stats()["flush_timeouts"] == 1
+
+    repo.release.set()
+    buffer.flush("slow", timeout=5)
+    assert [row["content"] for row in repo.list_task_chats("slow")] == ["eventually"]
+
+
+def test_only_the_last_status_of_a_task_is_written(buffer):
+    repo = SQLiteRepository()
+    repo.insert_rows("s_tasks", [{"id": "task-1", "task_status": "idle"}])
+    set_repository(repo)
+    for status in ("agent_processing", "agent_responded"):
+        buffer.update_status("task-1", status)
+    buffer.flush("task-1")
+    assert repo.get_task("task-1")["task_status"] == "agent_responded"
+    assert buffer.stats()["coalesced"] == 1
@@ -0,0 +1,207 @@
+# tool_cache.py
+
+from typing import Any, Dict, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024"))
+# When set, responses are shared by every worker process on the host through this SQLite file
+TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH")
+
+CACHEABLE_METHODS = ("GET", "HEAD")
+
+
+class MemoryToolCache:
+    """In-process LRU store of tool responses"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return dict(entry) if entry is not None else None
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SqliteToolCache:
+    """Host-local store shared between worker processes; evicts least recently used rows"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tool_cache ("
+                "key TEXT PRIMARY KEY, entry TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS tool_cache_last_access ON tool_cache (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        row = conn.execute("SELECT entry FROM tool_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE tool_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO tool_cache (key, entry, last_access) VALUES (?, ?, ?)",
+            (key, json.dumps(entry), time.time()),
+        )
+        conn.execute(
+            "DELETE FROM tool_cache WHERE key IN ("
+            "SELECT key FROM tool_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM tool_cache")
+
+    def size(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM tool_cache").fetchone()[0]
+
+
+_store: Any = None
+_store_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stale": 0, "revalidated": 0, "stored": 0, "uncacheable": 0}
+_stats_lock = threading.Lock()
+
+
+def _get_store() -> Any:
+    """Open the backing store on first use so importing this module does no I/O"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SqliteToolCache(TOOL_CACHE_PATH, TOOL_CACHE_MAX_ENTRIES) if TOOL_CACHE_PATH else MemoryToolCache(TOOL_CACHE_MAX_ENTRIES)
+    return _store
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_key(method: str, url: str, params: Dict[str, Any], headers: Dict[str, Any], body: Any = None) -> str:
+    """Stable key for a request; headers and body are included so neither credentials nor payloads share an entry"""
+    raw = json.dumps([method.upper(), url, params or {}, headers or {}, body], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(method: str, ttl_seconds: Optional[float]) -> bool:
+    return bool(ttl_seconds) and method.upper() in CACHEABLE_METHODS
+
+
+def lookup(key: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """Return (entry, fresh); a stale entry with validators can still be revalidated"""
+    entry = _get_store().get(key)
+    if entry is None:
+        _count("misses")
+        return None, False
+    if entry["expires_at"] > time.time():
+        _count("hits")
+        return entry, True
+    _count("stale")
+    return entry, False
+
+
+def conditional_headers(entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """If-None-Match / If-Modified-Since for revalidating a stale entry"""
+    headers: Dict[str, str] = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def _response_ttl(response_headers: Any, ttl_seconds: float) -> Optional[float]:
+    """Configured TTL bounded by the response's Cache-Control; None when it must not be stored"""
+    directives = {}
+    for part in (response_headers.get("Cache-Control") or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"')
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name, "").isdigit():
+            return min(float(ttl_seconds), float(directives[name]))
+    return float(ttl_seconds)
+
+
+def store(key: str, response: Any, ttl_seconds: float) -> None:
+    """Store a successful requests/httpx response if its headers allow it"""
+    ttl = _response_ttl(response.headers, ttl_seconds)
+    if ttl is None:
+        _count("uncacheable")
+        return
+    _get_store().set(key, {
+        "text": response.text,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "expires_at": time.time() + ttl,
+    })
+    _count("stored")
+
+
+def refresh(key: str, entry: Dict[str, Any], response: Any, ttl_seconds: float) -> None:
+    """Extend a stale entry after a 304 Not Modified"""
+    ttl = _response_ttl(response.headers, ttl_seconds)
+    entry = {k: v for k, v in entry.items() if k != "fresh"}
+    entry["expires_at"] = time.time() + (ttl or 0.0)
+    if response.headers.get("ETag"):
+        entry["etag"] = response.headers.get("ETag")
+    _get_store().set(key, entry)
+    _count("revalidated")
+
+
+def clear_tool_cache() -> None:
+    _get_store().clear()
+
+
+def tool_cache_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["size"] = _get_store().size()
+    stats["max_entries"] = TOOL_CACHE_MAX_ENTRIES
+    stats["backend"] = "sqlite" if TOOL_CACHE_PATH else "memory"
+    return stats
@@ -0,0 +1,209 @@
+# tool_registry.py
+
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+from dataclasses import dataclass
+from types import MappingProxyType
+from urllib.parse import urlparse
+import hashlib
+import json
+import threading
+from logging_setup import get_logger, truncate
+
+if TYPE_CHECKING:
+    from api_tool import APICallTool
+
+logger = get_logger("tool_registry")
+
+HTTP_METHODS = ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS")
+
+
+class ToolSpecError(ValueError):
+    """An api_metadata row that cannot be turned into a tool"""
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """Validated, immutable definition of one API tool, compiled from its api_metadata row"""
+
+    id: str
+    version: str
+    name: str
+    description: str
+    endpoint_url: str
+    http_method: str
+    headers: "MappingProxyType[str, Any]"
+    query_params: "MappingProxyType[str, Any]"
+    body: "MappingProxyType[str, Any]"
+    connect_timeout: Optional[float]
+    read_timeout: Optional[float]
+    cache_ttl_seconds: Optional[float]
+
+
+def _json_object(row: Dict[str, Any], column: str) -> "MappingProxyType[str, Any]":
+    value = row.get(column)
+    if isinstance(value, str):
+        if value.strip().lower() in ("", "none", "null"):
+            value = None
+        else:
+            try:
+                value = json.loads(value)
+            except ValueError as e:
+                raise ToolSpecError(f"{column} is not valid JSON: {e}")
+    if value is None:
+        return MappingProxyType({})
+    if not isinstance(value, dict):
+        raise ToolSpecError(f"{column} must be a JSON object, got {type(value).__name__}")
+    return MappingProxyType(value)
+
+
+def _seconds(row: Dict[str, Any], column: str) -> Optional[float]:
+    value = row.get(column)
+    if value is None:
+        return None
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        raise ToolSpecError(f"{column} must be a number of seconds, got {value!r}")
+    if seconds < 0:
+        raise ToolSpecError(f"{column} must not be negative")
+    return seconds
+
+
+def content_version(row: Dict[str, Any]) -> str:
+    """Hash of every column of a row: changes with its content even when updated_at is not maintained"""
+    return hashlib.sha256(json.dumps(row, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def compile_tool_spec(row: Dict[str, Any]) -> ToolSpec:
+    """Parse and validate an api_metadata row; raises ToolSpecError describing what is wrong"""
+    for column in ("id", "name", "endpoint_url", "http_method"):
+        if not row.get(column):
+            raise ToolSpecError(f"{column} is missing")
+    url = urlparse(str(row["endpoint_url"]))
+    if url.scheme not in ("http", "https") or not url.netloc:
+        raise ToolSpecError("endpoint_url must be an absolute http(s) URL")
+    method = str(row["http_method"]).upper()
+    if method not in HTTP_METHODS:
+        raise ToolSpecError(f"http_method {row['http_method']!r} is not one of {', '.join(HTTP_METHODS)}")
+    return ToolSpec(
+        id=str(row["id"]),
+        version=content_version(row),
+        name=str(row["name"]),
+        description=row.get("tool_description") or "No description",
+        endpoint_url=str(row["endpoint_url"]),
+        http_method=method,
+        headers=_json_object(row, "headers"),
+        query_params=_json_object(row, "query_params"),
+        body=_json_object(row, "body"),
+        connect_timeout=_seconds(row, "connect_timeout"),
+        read_timeout=_seconds(row, "read_timeout"),
+        cache_ttl_seconds=_seconds(row, "cache_ttl_seconds"),
+    )
+
+
+class ToolRegistry:
+    """Compiled tool specs keyed by api_metadata id, recompiled only when the row's content changes
+
+    Each spec is validated into an APICallTool once; further instances are copies of
+    that prototype, without running pydantic validation again.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._invalid: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.compiled = 0
+        self.reused = 0
+        self.instances = 0
+
+    def spec(self, row: Dict[str, Any]) -> Optional[ToolSpec]:
+        """Compiled spec of a row, or None (reported once per version) when the row is invalid"""
+        tool_id = str(row.get("id"))
+        version = content_version(row)
+        with self._lock:
+            entry = self._entries.get(tool_id)
+            if entry is not None and entry["spec"].version == version:
+                self.reused += 1
+                return entry["spec"]
+            invalid = self._invalid.get(tool_id)
+            if invalid is not None and invalid["version"] == version:
+                return None
+        try:
+            spec = compile_tool_spec(row)
+        except ToolSpecError as e:
+            logger.error("Invalid tool metadata", extra={"fields": {
+                "tool_id": tool_id, "tool_name": row.get("name"), "version": version, "error": truncate(str(e))
+            }})
+            with self._lock:
+                self._entries.pop(tool_id, None)
+                self._invalid[tool_id] = {"version": version, "name": row.get("name"), "error": str(e)}
+            return None
+        with self._lock:
+            self._invalid.pop(tool_id, None)
+            self._entries[tool_id] = {"spec": spec, "prototype": None}
+            self.compiled += 1
+        return spec
+
+    def instantiate(self, spec: ToolSpec) -> "APICallTool":
+        """A new tool instance for spec; only the first one per version pays for validation"""
+        with self._lock:
+            entry = self._entries.get(spec.id)
+            prototype = entry["prototype"] if entry is not None and entry["spec"] is spec else None
+        if prototype is None:
+            from api_tool import APICallTool
+            prototype = APICallTool(
+                name=spec.name,
+                description=spec.description,
+                endpoint_url=spec.endpoint_url,
+                http_method=spec.http_method,
+                headers=dict(spec.headers),
+                query_params=dict(spec.query_params),
+                body=dict(spec.body),
+                connect_timeout=spec.connect_timeout,
+                read_timeout=spec.read_timeout,
+                cache_ttl_seconds=spec.cache_ttl_seconds
+            )
+            with self._lock:
+                entry = self._entries.get(spec.id)
+                if entry is not None and entry["spec"] is spec:
+                    entry["prototype"] = prototype
+        with self._lock:
+            self.instances += 1
+        # Agents keep per-instance state (e.g. usage counts), so every agent build gets its own copy;
+        # the dict fields are copied too, a shallow copy would share them with the prototype
+        return prototype.model_copy(update={
+            "headers": dict(spec.headers),
+            "query_params": dict(spec.query_params),
+            "body": dict(spec.body),
+        })
+
+    def specs(self, rows: List[Dict[str, Any]], tool_ids: Optional[List[str]] = None) -> List[ToolSpec]:
+        """Specs of the valid rows; ids in tool_ids without a row are reported as missing"""
+        if tool_ids:
+            found = {str(row.get("id")) for row in rows}
+            missing = [str(tool_id) for tool_id in tool_ids if str(tool_id) not in found]
+            if missing:
+                logger.warning("Tools not found in api_metadata", extra={"fields": {"tool_ids": missing}})
+        return [spec for spec in (self.spec(row) for row in rows) if spec is not None]
+
+    def build_tools(self, rows: List[Dict[str, Any]], tool_ids: Optional[List[str]] = None) -> List["APICallTool"]:
+        """Tool instances for the valid rows"""
+        return [self.instantiate(spec) for spec in self.specs(rows, tool_ids)]
+
+    def invalid_tools(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {tool_id: dict(entry) for tool_id, entry in self._invalid.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "invalid": len(self._invalid),
+                "compiled": self.compiled,
+                "reused": self.reused,
+                "instances": self.instances,
+            }
+
+
+tool_registry = ToolRegistry()
+
@@ -0,0 +1,128 @@
+# worker.py
+"""
+Agent worker process: runs jobs that /process-task enqueued with "mode": "queue".
+
+    python -m worker --concurrency 8
+
+Start one per core (or per host) next to any number of web processes; they share
+JOB_QUEUE_PATH and the configured data backend. Queued jobs survive restarts, and a
+job whose worker dies is retried once its lease expires (up to JOB_MAX_ATTEMPTS).
+"""
+
+from typing import Any, Dict, Set
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import uuid
+
+from fastapi import HTTPException
+from job_queue import JOB_LEASE_SECONDS, get_job_queue
+from orchestrator import start_claimed_task, record_task_failure
+from data_service_other import close_write_buffer
+from worker_pool import AGENT_WORKERS, start_worker_pool, shutdown_worker_pool, shutdown_io_executor
+from http_client import aclose_http_clients
+from logging_setup import configure_logging, get_logger
+from supabase_client import init_supabase, aclose_async_supabase
+from repository import DATA_BACKEND
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", str(AGENT_WORKERS)))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "0.5"))
+
+logger = get_logger("worker")
+
+
+async def _renew_lease(job: Dict[str, Any], run: Any) -> None:
+    queue = get_job_queue()
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        if await asyncio.to_thread(queue.heartbeat, job["id"]):
+            run.cancel_requested.set()
+
+
+async def _process_job(job: Dict[str, Any]) -> None:
+    queue = get_job_queue()
+    fields = {"job_id": job["id"], "task_id": job["task_id"], "attempt": job["attempts"]}
+    logger.info("Job started", extra={"fields": fields})
+    try:
+        # Strict, so a job marked completed always has its response persisted
+        run = start_claimed_task(job["task_id"], job["agent_id"], job["user_message"], "queue", consistency="strict")
+    except Exception as e:
+        error_msg = await asyncio.to_thread(record_task_failure, job["task_id"], e)
+        await asyncio.to_thread(queue.finish, job["id"], "failed", error=error_msg)
+        return
+
+    if job["cancel_requested"]:
+        run.cancel_requested.set()
+    renewal = asyncio.create_task(_renew_lease(job, run))
+    try:
+        result = await run.wait()
+        await asyncio.to_thread(
+            queue.finish, job["id"], "completed", agent_response=result["agent_response"], timing=result["timing"]
+        )
+        logger.info("Job completed", extra={"fields": dict(fields, run_ms=result["timing"].get("run_ms"))})
+    except HTTPException as e:
+        status = "cancelled" if e.status_code == 409 else "failed"
+        await asyncio.to_thread(queue.finish, job["id"], status, error=e.detail)
+        logger.info("Job finished", extra={"fields": dict(fields, status=status)})
+    finally:
+        renewal.cancel()
+
+
+async def serve(concurrency: int = WORKER_CONCURRENCY, poll_interval: float = WORKER_POLL_INTERVAL) -> None:
+    """Claim jobs while fewer than `concurrency` run here; drains running jobs on SIGINT/SIGTERM"""
+    queue = get_job_queue()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    # Exactly as many agent threads as jobs claimed, so admission never rejects a claimed job
+    start_worker_pool(max_workers=concurrency, max_queue=0)
+    active: Set["asyncio.Task[None]"] = set()
+    logger.info("Worker started", extra={"fields": {"worker_id": worker_id, "concurrency": concurrency}})
+    try:
+        while not stop.is_set():
+            for job in await asyncio.to_thread(queue.reap_expired):
+                await asyncio.to_thread(record_task_failure, job["task_id"], RuntimeError(job["error"]))
+            while len(active) < concurrency:
+                job = await asyncio.to_thread(queue.claim, worker_id)
+                if job is None:
+                    break
+                task = asyncio.create_task(_process_job(job))
+                active.add(task)
+                task.add_done_callback(active.discard)
+            try:
+                await asyncio.wait_for(stop.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        if active:
+            logger.info("Worker draining", extra={"fields": {"running": len(active)}})
+            await asyncio.wait(active)
+    finally:
+        shutdown_worker_pool(wait=False)
+        shutdown_io_executor(wait=False)
+        await aclose_http_clients()
+        close_write_buffer()
+        await aclose_async_supabase()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="Jobs run at once by this process")
+    parser.add_argument("--poll-interval", type=float, default=WORKER_POLL_INTERVAL, help="Seconds between queue polls when idle")
+    args = parser.parse_args()
+
+    configure_logging()
+    if DATA_BACKEND == "supabase":
+        init_supabase()
+    asyncio.run(serve(args.concurrency, args.poll_interval))
+
+
+if __name__ == "__main__":
+    main()
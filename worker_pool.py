@@ -0,0 +1,152 @@
+# worker_pool.py
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import os
+import threading
+import time
+
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "8"))
+AGENT_QUEUE_SIZE = int(os.getenv("AGENT_QUEUE_SIZE", "32"))
+IO_WORKERS = int(os.getenv("IO_WORKERS", "16"))
+
+
+class PoolSaturatedError(Exception):
+    """Raised when the admission queue is full"""
+
+    def __init__(self, queue_depth: int, max_queue: int, running: int):
+        self.queue_depth = queue_depth
+        self.max_queue = max_queue
+        self.running = running
+        super().__init__(f"Agent queue is full ({queue_depth}/{max_queue} waiting, {running} running)")
+
+
+class AgentWorkerPool:
+    """Long-lived bounded executor with an admission queue in front of it"""
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-worker")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self.rejected = 0
+        self.completed = 0
+
+    def admit(self) -> int:
+        """Reserve a slot (running or waiting); returns the queue depth ahead of the caller"""
+        with self._lock:
+            if self._running + self._queued >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise PoolSaturatedError(self._queued, self.max_queue, self._running)
+            self._queued += 1
+            # Depth seen by this request: callers ahead of it that are still waiting
+            return max(0, self._queued + self._running - self.max_workers)
+
+    def release(self) -> None:
+        """Give back a slot reserved with admit() that will not be run"""
+        with self._lock:
+            self._queued -= 1
+
+    def _wrap(self, fn: Callable[..., Any], timing: Dict[str, float], submitted_at: float,
+              on_start: Optional[Callable[[], None]]) -> Callable[..., Any]:
+        def run(*args: Any) -> Any:
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            timing["queue_wait_ms"] = round((started_at - submitted_at) * 1000, 2)
+            try:
+                if on_start is not None:
+                    on_start()
+                return fn(*args)
+            finally:
+                timing["run_ms"] = round((time.perf_counter() - started_at) * 1000, 2)
+                with self._lock:
+                    self._running -= 1
+                    self.completed += 1
+        return run
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Tuple[Any, Dict[str, float]]:
+        """Run fn(*args) on the pool; returns (result, timing) or raises PoolSaturatedError"""
+        return await self.run_admitted(self.admit(), fn, *args)
+
+    async def run_admitted(self, queue_depth: int, fn: Callable[..., Any], *args: Any,
+                           on_start: Optional[Callable[[], None]] = None) -> Tuple[Any, Dict[str, float]]:
+        """Run fn(*args) in a slot already reserved with admit()"""
+        timing: Dict[str, float] = {"queue_depth": queue_depth}
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor, self._wrap(fn, timing, time.perf_counter(), on_start), *args)
+        except BaseException:
+            self.release()
+            raise
+        result = await future
+        return result, timing
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._queued,
+                "rejected": self.rejected,
+                "completed": self.completed,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_pool: Optional[AgentWorkerPool] = None
+_io_executor: Optional[ThreadPoolExecutor] = None
+_io_lock = threading.Lock()
+
+
+def start_worker_pool(max_workers: int = AGENT_WORKERS, max_queue: int = AGENT_QUEUE_SIZE) -> AgentWorkerPool:
+    """Create the process-wide pool (called from the FastAPI lifespan)"""
+    global _pool
+    if _pool is None:
+        _pool = AgentWorkerPool(max_workers, max_queue)
+    return _pool
+
+
+def get_worker_pool() -> AgentWorkerPool:
+    """Return the process-wide pool, creating it lazily outside the app lifespan (scripts, tests)"""
+    return _pool if _pool is not None else start_worker_pool()
+
+
+def shutdown_worker_pool(wait: bool = True) -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait)
+        _pool = None
+
+
+def submit_io(fn: Callable[..., Any], *args: Any) -> "Future[Any]":
+    """Run a blocking data-access call on the I/O pool so independent fetches overlap
+
+    Kept separate from the agent pool so an agent thread waiting on a fetch can never deadlock it.
+    """
+    global _io_executor
+    if _io_executor is None:
+        with _io_lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="data-io")
+    return _io_executor.submit(fn, *args)
+
+
+async def run_io(fn: Callable[..., Any], *args: Any) -> Any:
+    """Await a blocking data-access call on the I/O pool without stalling the event loop"""
+    return await asyncio.wrap_future(submit_io(fn, *args))
+
+
+def shutdown_io_executor(wait: bool = True) -> None:
+    global _io_executor
+    with _io_lock:
+        if _io_executor is not None:
+            _io_executor.shutdown(wait=wait, cancel_futures=True)
+            _io_executor = None
@@ -0,0 +1,234 @@
+# write_behind.py
+
+from typing import Any, Callable, Dict, List, Optional, Set
+from datetime import datetime, timezone
+import atexit
+import os
+import threading
+import time
+import uuid
+from repository import get_repository
+from logging_setup import get_logger
+
+# Max delay before buffered chat inserts and status updates are written; 0 writes each one immediately
+WRITE_BEHIND_INTERVAL_SECONDS = float(os.getenv("WRITE_BEHIND_INTERVAL_MS", "50")) / 1000
+# Pending writes that trigger a flush before the interval elapses
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500"))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "3"))
+# Longest a flush() caller waits for the buffered writes (e.g. while storage is down); they are still written later
+WRITE_BEHIND_FLUSH_TIMEOUT_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_TIMEOUT_SECONDS", "30"))
+
+logger = get_logger("write_behind")
+
+
+class WriteFailedError(Exception):
+    """A buffered write for a task could not be persisted"""
+
+
+class WriteBehindBuffer:
+    """Collects chat inserts and status updates from all tasks and writes them in bulk
+
+    Each flush inserts every pending chat row in one statement, then applies the
+    last pending status of each task with one statement per distinct status, so a
+    task's response row is always visible before the status that announces it.
+    """
+
+    def __init__(self, interval: float, max_batch: int, on_written: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                 flush_timeout: Optional[float] = None):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.flush_timeout = flush_timeout
+        self.on_written = on_written
+        self._ops: List[Dict[str, Any]] = []
+        self._pending: Dict[str, int] = {}
+        self._statuses: Dict[str, str] = {}
+        self._failed: Set[str] = set()
+        self._seq = 0
+        self._written_seq = 0
+        self._flush_requested = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"chats": 0, "statuses": 0, "coalesced": 0, "flushes": 0, "statements": 0, "failures": 0, "flush_timeouts": 0}
+
+    def _start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._flush_loop, name="write-behind", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _enqueue(self, op: Dict[str, Any]) -> None:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write-behind buffer is closed")
+            self._start()
+            self._seq += 1
+            op["seq"] = self._seq
+            self._ops.append(op)
+            self._pending[op["task_id"]] = self._pending.get(op["task_id"], 0) + 1
+            if op["kind"] == "status":
+                self._statuses[op["task_id"]] = op["status"]
+            if len(self._ops) >= self.max_batch:
+                self._flush_requested = True
+                self._cond.notify_all()
+
+    def insert_chat(self, task_id: str, role: str, content: str) -> None:
+        # created_at is taken now, not at flush time, so rows of one bulk insert keep their order;
+        # the id is too, so the rows are known after a flush without reading them back
+        self._enqueue({"kind": "chat", "task_id": task_id, "row": {
+            "id": str(uuid.uuid4()), "task_id": task_id, "role": role, "content": content,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }})
+
+    def update_status(self, task_id: str, status: str) -> None:
+        self._enqueue({"kind": "status", "task_id": task_id, "status": status})
+
+    def pending_status(self, task_id: str) -> Optional[str]:
+        """Status written for a task but not flushed yet"""
+        with self._cond:
+            return self._statuses.get(task_id)
+
+    def has_pending(self, task_id: str) -> bool:
+        with self._cond:
+            return task_id in self._pending
+
+    def flush(self, task_id: Optional[str] = None, timeout: Optional[float] = None) -> None:
+        """Write everything buffered so far before returning; raises WriteFailedError if task_id's writes failed
+
+        Waits at most timeout seconds (flush_timeout by default), then raises WriteFailedError.
+        """
+        if timeout is None:
+            timeout = self.flush_timeout
+        with self._cond:
+            target = self._seq
+            if self._written_seq < target:
+                self._start()
+                self._flush_requested = True
+                self._cond.notify_all()
+                if not self._cond.wait_for(lambda: self._written_seq >= target, timeout):
+                    self._stats["flush_timeouts"] += 1
+                    logger.warning("Write-behind flush timed out", extra={"fields": {
+                        "task_id": task_id, "timeout_seconds": timeout, "pending": len(self._ops)
+                    }})
+                    raise WriteFailedError(f"Timed out flushing writes{f' of task {task_id}' if task_id else ''}")
+            if task_id is not None and task_id in self._failed:
+                self._failed.discard(task_id)
+                raise WriteFailedError(f"Buffered writes of task {task_id} could not be persisted")
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._flush_requested or self._closed, self.interval)
+                self._flush_requested = False
+                ops, self._ops = self._ops, []
+                closed = self._closed
+            if ops:
+                self._write(ops)
+            if closed:
+                with self._cond:
+                    if not self._ops:
+                        return
+
+    def _write(self, ops: List[Dict[str, Any]]) -> None:
+        chats = [op["row"] for op in ops if op["kind"] == "chat"]
+        # Only the last status of each task in the batch is written
+        statuses: Dict[str, str] = {}
+        for op in ops:
+            if op["kind"] == "status":
+                statuses[op["task_id"]] = op["status"]
+        by_status: Dict[str, List[str]] = {}
+        for task_id, status in statuses.items():
+            by_status.setdefault(status, []).append(task_id)
+
+        # Each step is one statement, paired with the ops to write one by one if it keeps failing
+        repo = get_repository()
+        steps: List[tuple] = []
+        if chats:
+            steps.append((lambda: repo.insert_task_chats(chats), [op for op in ops if op["kind"] == "chat"]))
+        for status, task_ids in by_status.items():
+            steps.append((
+                lambda status=status, task_ids=task_ids: repo.update_tasks_status(task_ids, status),
+                [{"kind": "status", "task_id": task_id, "status": status} for task_id in task_ids]
+            ))
+
+        failed: Set[str] = set()
+        written_chats = list(chats)
+        statements = 0
+        for step, step_ops in steps:
+            # Steps already written are never repeated, so a retry cannot duplicate chat rows
+            for attempt in range(WRITE_BEHIND_MAX_RETRIES):
+                try:
+                    step()
+                    statements += 1
+                    break
+                except Exception as e:
+                    logger.warning("Write-behind flush failed", extra={"fields": {
+                        "attempt": attempt + 1, "rows": len(step_ops), "error": str(e)
+                    }})
+                    time.sleep(min(1.0, 0.05 * 2 ** attempt))
+            else:
+                # Isolate the rows that keep failing so the rest of the batch still lands
+                dropped = self._write_each(step_ops)
+                statements += len(step_ops)
+                failed |= {op["task_id"] for op in dropped}
+                if step_ops[0]["kind"] == "chat":
+                    dropped_ids = {op["row"]["id"] for op in dropped}
+                    written_chats = [row for row in chats if row["id"] not in dropped_ids]
+
+        # Before waiters are released, so a flush() caller reads what was just written
+        if self.on_written is not None:
+            try:
+                self.on_written(written_chats)
+            except Exception as e:
+                logger.warning("Write-behind callback failed", extra={"fields": {"error": str(e)}})
+
+        with self._cond:
+            for op in ops:
+                count = self._pending.get(op["task_id"], 0) - 1
+                if count > 0:
+                    self._pending[op["task_id"]] = count
+                else:
+                    self._pending.pop(op["task_id"], None)
+                    self._statuses.pop(op["task_id"], None)
+            self._failed |= failed
+            self._written_seq = ops[-1]["seq"]
+            self._stats["chats"] += len(chats)
+            self._stats["statuses"] += len(statuses)
+            self._stats["coalesced"] += sum(1 for op in ops if op["kind"] == "status") - len(statuses)
+            self._stats["flushes"] += 1
+            self._stats["statements"] += statements
+            self._stats["failures"] += len(failed)
+            self._cond.notify_all()
+
+    @staticmethod
+    def _write_each(ops: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Write ops one at a time; returns the ones that failed"""
+        repo = get_repository()
+        dropped: List[Dict[str, Any]] = []
+        for op in ops:
+            try:
+                if op["kind"] == "chat":
+                    repo.insert_task_chats([op["row"]])
+                else:
+                    repo.update_task_status(op["task_id"], op["status"])
+            except Exception as e:
+                dropped.append(op)
+                logger.error("Buffered write dropped", extra={"fields": {
+                    "task_id": op["task_id"], "kind": op["kind"], "error": str(e)
+                }})
+        return dropped
+
+    def close(self) -> None:
+        """Flush what is buffered and stop the flush thread"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout=10)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self._stats, pending=len(self._ops), interval_ms=self.interval * 1000)